@@ -5,14 +5,59 @@
 from grid import *
 from statistics import mean
 import random
+import asyncio
 import copy
 import collections
+import collections.abc
+import inspect
+import json
+import multiprocessing
+import pickle
+import time
+import tracemalloc
 
 
 # Classe que representa objetos físicos que podem aparecer em um ambiente.
 # Cada "coisa" pode ter um atributo .__name__ usado para output
 class Thing(object):
 
+    # Thing e Agent guardam seus atributos (inclusive __name__) em slots, sem __dict__,
+    # para ocupar menos memória. Subclasses sem __slots__ (Food, RoboDog...) ganham
+    # __dict__ e podem ter quaisquer outros atributos, como antes
+    __slots__ = ('_location', '_envs', '__name__')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Uma subclasse pode definir location como atributo de classe (localização padrão, como
+        # no RoboDog do notebook); ele esconderia a property, então vira _default_location
+        if 'location' in cls.__dict__ and not isinstance(cls.__dict__['location'], property):
+            cls._default_location = cls.__dict__['location']
+            delattr(cls, 'location')
+
+    @property
+    def location(self):
+        try:
+            return self._location
+        except AttributeError:
+            try:
+                return self._default_location
+            except AttributeError:
+                raise AttributeError('location') from None
+
+    @location.setter
+    def location(self, value):
+        # Ao mudar de localização, a coisa é movida no índice espacial de cada ambiente em
+        # que está (como antes, a mesma coisa pode estar em mais de um ambiente)
+        envs = getattr(self, '_envs', None)
+        if envs:
+            for env in envs:
+                env._unindex_thing(self)
+            self._location = value
+            for env in envs:
+                env._index_thing(self)
+        else:
+            self._location = value
+
     def __repr__(self):
         return '<{}>'.format(getattr(self, '__name__', self.__class__.__name__))
 
@@ -39,7 +84,13 @@ class Agent(Thing):
      Isso não deve ser feito. Um programa de agente que precisa de um modelo do mundo (e do
      próprio agente) terá que construir e manter seu próprio modelo.
      Há um slot opcional, .performance, que é um número que dá
-     a medida de desempenho do agente em seu ambiente.."""
+     a medida de desempenho do agente em seu ambiente..
+     Os atributos de Agent e Thing ficam em slots: além de alive, bump, holding,
+     performance, program, direction (opcional, um Direction), location e __name__,
+     instâncias de Agent e Thing não aceitam outros atributos. Para guardar outros
+     atributos no agente, crie uma subclasse (sem __slots__, ela volta a ter __dict__)."""
+
+    __slots__ = ('alive', 'bump', 'holding', 'performance', 'program', 'direction')
 
     def __init__(self, program=None):
         self.alive = True
@@ -49,7 +100,7 @@ class Agent(Thing):
         if program is None:
             def program(percept):
                 return eval(input('Percept={}; action? ' .format(percept)))
-        assert isinstance(program, collections.Callable)
+        assert isinstance(program, collections.abc.Callable)
         self.program = program
 
     def can_grab(self, thing):
@@ -75,16 +126,64 @@ def TableDrivenAgentProgram(table):
     """Esse agente seleciona uma ação baseada na sequência de percepção.
      É prático apenas para domínios minúsculos.
      Para personalizá-lo, forneça como tabela um dicionário de todos os pares
-     {Percept_sequence: action}.["""
-    percepts = []
+     {Percept_sequence: action}.
+     A tabela é convertida em uma trie de sequências de percepções, e o programa só
+     avança um cursor a cada percepção, sem guardar o histórico. Quando a sequência
+     sai da tabela, nenhuma sequência maior está nela, e a ação passa a ser sempre None."""
+    # Cada nó da trie é [ação, {percepção: nó filho}]
+    root = [None, {}]
+    for percepts, action in table.items():
+        if isinstance(percepts, tuple):
+            node = root
+            for percept in percepts:
+                node = node[1].setdefault(percept, [None, {}])
+            node[0] = action
+    cursor = root
 
     def program(percept):
-        percepts.append(percept)
-        action = table.get(tuple(percepts))
-        return action
+        nonlocal cursor
+        if cursor is not None:
+            cursor = cursor[1].get(percept)
+        return None if cursor is None else cursor[0]
+    return program
+
+
+def batchable(program):
+    """Marca um programa de agente como vetorizável: em vez de uma percepção, ele recebe
+     a sequência de percepções de todos os agentes vivos que compartilham esse programa
+     (como devolvida por Environment.percepts_batch) e retorna uma sequência de ações,
+     na mesma ordem. Pode ser usado como decorador. O programa deve ser marcado antes
+     de o agente ser adicionado ao ambiente, que conta os agentes vetorizáveis em add_thing."""
+    program.batchable = True
     return program
 
 
+def ThreadedAgentProgram(program):
+    """Transforma um programa bloqueante (ex.: o programa padrão, que usa input) em um
+     programa assíncrono, executado em uma thread, para que Environment.run_async
+     continue avançando os outros ambientes enquanto ele espera.
+     Uma thread não pode ser interrompida, então há no máximo uma chamada em andamento:
+     se um passo desiste dela por timeout (veja Environment.step_async), o passo seguinte
+     volta a aguardar a mesma chamada em vez de começar outra, e a ação que ela devolver
+     (para a percepção antiga) vale para o passo em que chegar. Por isso, cada agente
+     deve ter o seu próprio ThreadedAgentProgram."""
+    pending = None
+
+    async def async_program(percept):
+        nonlocal pending
+        loop = asyncio.get_event_loop()
+        if pending is None or pending.get_loop() is not loop:
+            pending = loop.run_in_executor(None, program, percept)
+        call = pending
+        try:
+            # shield: o timeout cancela só a espera, não a chamada em andamento
+            return await asyncio.shield(call)
+        finally:
+            if call.done():
+                pending = None
+    return async_program
+
+
 def RandomAgentProgram(actions):
     "Um agente que escolhe uma ação aleatoriamente, ignorando todas as percepções."
     return lambda percept: random.choice(actions)
@@ -112,12 +211,221 @@ def ModelBasedReflexAgentProgram(rules, update_state):
 
 
 def rule_match(state, rules):
-    "Encontre a primeira regra que corresponda ao estado."
+    """Encontre a primeira regra que corresponda ao estado.
+     Se rules for um RuleBase, usa seus índices em vez de percorrer todas as regras."""
+    if isinstance(rules, RuleBase):
+        return rules.match(state)
     for rule in rules:
         if rule.matches(state):
             return rule
 
 
+class Rule(object):
+
+    """Regra condição-ação que corresponde aos estados cuja característica é igual a key.
+    A característica é feature(state), ou o próprio estado se feature for None.
+    Como key e feature são conhecidos, o RuleBase consegue indexar a regra."""
+
+    def __init__(self, key, action, feature=None):
+        self.key = key
+        self.action = action
+        self.feature = feature
+
+    def matches(self, state):
+        return (state if self.feature is None else self.feature(state)) == self.key
+
+    def __repr__(self):
+        return '<Rule {!r} -> {!r}>'.format(self.key, self.action)
+
+
+class RuleBase(object):
+
+    """Base de regras compilada para rule_match, com a mesma semântica de primeira
+    regra que corresponde ao estado. Regras com atributos key (hashável) e feature
+    (como em Rule) são indexadas em um dicionário por feature: um estado custa uma
+    consulta por feature distinta. As demais só precisam de matches, e são percorridas
+    linearmente, apenas as que vêm antes da melhor regra indexada encontrada.
+    Os resultados de estados hasháveis são memorizados (até memo_size estados),
+    então as regras não devem mudar depois de compiladas."""
+
+    def __init__(self, rules, memo_size=10000):
+        self.rules = list(rules)
+        self._indexes = collections.OrderedDict()
+        self._linear = []
+        for position, rule in enumerate(self.rules):
+            key = getattr(rule, 'key', None)
+            try:
+                hash(key)
+            except TypeError:
+                key = None
+            if key is None:
+                self._linear.append((position, rule))
+            else:
+                index = self._indexes.setdefault(getattr(rule, 'feature', None), {})
+                index.setdefault(key, (position, rule))
+        self.memo_size = memo_size
+        self._memo = {}
+
+    def match(self, state):
+        "Retorna a primeira regra que corresponde ao estado, ou None."
+        try:
+            return self._memo[state]
+        except KeyError:
+            rule = self._match(state)
+            if len(self._memo) >= self.memo_size:
+                self._memo.clear()
+            self._memo[state] = rule
+            return rule
+        except TypeError:
+            return self._match(state)
+
+    def _match(self, state):
+        best, found = len(self.rules), None
+        for feature, index in self._indexes.items():
+            try:
+                position, rule = index[state if feature is None else feature(state)]
+            except (KeyError, TypeError):
+                continue
+            if position < best:
+                best, found = position, rule
+        for position, rule in self._linear:
+            if position >= best:
+                break
+            if rule.matches(state):
+                return rule
+        return found
+
+    def __iter__(self):
+        return iter(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+
+class ThingRegistry(object):
+
+    """Coleção de coisas em ordem de inserção, indexada pela identidade de cada coisa.
+    Pertinência, inserção e remoção custam O(1), ao contrário de uma lista, e a
+    iteração percorre uma cópia na ordem de inserção, então é determinística e
+    segura mesmo que coisas sejam removidas durante o laço."""
+
+    def __init__(self, things=()):
+        self._things = {}
+        self._positions = {}
+        self._added = 0
+        for thing in things:
+            self.append(thing)
+
+    def append(self, thing):
+        "Adiciona a coisa ao final da coleção."
+        self._things[id(thing)] = thing
+        self._positions[id(thing)] = self._added
+        self._added += 1
+
+    def remove(self, thing):
+        "Remove a coisa; como em list.remove, gera ValueError se ela não estiver na coleção."
+        if id(thing) not in self._things:
+            raise ValueError("{} is not in registry".format(thing))
+        self.discard(thing)
+
+    def discard(self, thing):
+        "Remove a coisa, se estiver na coleção."
+        if self._things.pop(id(thing), None) is not None:
+            del self._positions[id(thing)]
+
+    def position(self, thing):
+        "Número crescente que indica a ordem em que a coisa foi inserida."
+        return self._positions[id(thing)]
+
+    def __contains__(self, thing):
+        return id(thing) in self._things
+
+    def __iter__(self):
+        return iter(list(self._things.values()))
+
+    def __len__(self):
+        return len(self._things)
+
+    def __getitem__(self, index):
+        return list(self._things.values())[index]
+
+    def __repr__(self):
+        return repr(list(self._things.values()))
+
+    def __getstate__(self):
+        # As chaves são ids, que mudam em cópias: a coleção é reconstruída a partir das coisas
+        return list(self._things.values())
+
+    def __setstate__(self, things):
+        self.__init__(things)
+
+
+class StepMonitor(object):
+
+    """Instrumentação de Environment.step e step_async, ativada com env.monitor = StepMonitor(...).
+    Acumula contadores e o tempo gasto em cada fase do passo (percepção, programa do
+    agente, execute_action e exogenous_change). O rastreamento é opcional: com sample > 0,
+    a cada `sample` passos guarda um registro do passo (tempos, percepções e ações) em um
+    buffer circular com os `capacity` registros mais recentes e, se `path` for dado, o
+    acrescenta a um arquivo JSON lines. Sem monitor (o padrão), step só paga um teste de None."""
+
+    PHASES = ('percept', 'program', 'execute_action', 'exogenous_change')
+
+    def __init__(self, capacity=1000, sample=0, path=None):
+        self.counters = collections.Counter()
+        self.actions = collections.Counter()
+        self.timings = dict.fromkeys(self.PHASES, 0.0)
+        self.trace = collections.deque(maxlen=capacity)
+        self.sample = sample
+        self.path = path
+        self._file = None
+
+    def record(self, agents, alive, percepts, actions, timings):
+        """Registra um passo. alive, percepts e actions estão na ordem de agents;
+        agentes que não estavam vivos no início do passo têm percepção None e ação ""."""
+        step = self.counters['steps']
+        self.counters['steps'] += 1
+        for phase, seconds in timings.items():
+            self.timings[phase] += seconds
+        for acted, action in zip(alive, actions):
+            if acted:
+                self.counters['programs'] += 1
+                self.actions[repr(action)] += 1
+            else:
+                self.counters['idle'] += 1
+        if self.sample and step % self.sample == 0:
+            entry = {'step': step, 'timings': timings,
+                     'agents': [{'agent': repr(agent), 'percept': percept, 'action': action}
+                                for agent, percept, action in zip(agents, percepts, actions)]}
+            self.trace.append(entry)
+            if self.path is not None:
+                if self._file is None:
+                    self._file = open(self.path, 'a')
+                self._file.write(json.dumps(entry, default=repr) + '\n')
+
+    def summary(self):
+        "Tempo total e médio por passo (em segundos) de cada fase."
+        steps = self.counters['steps'] or 1
+        return {phase: (seconds, seconds / steps) for phase, seconds in self.timings.items()}
+
+    def report(self):
+        print('{} passos, {} ações, {} agentes parados'.format(
+            self.counters['steps'], self.counters['programs'], self.counters['idle']))
+        for phase, (total, per_step) in self.summary().items():
+            print('{:18} {:10.4f} s  {:10.2f} us/passo'.format(phase, total, per_step * 1e6))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __getstate__(self):
+        # O arquivo aberto não é copiado: a cópia reabre o mesmo caminho quando precisar
+        state = self.__dict__.copy()
+        state['_file'] = None
+        return state
+
+
 # Ambiente
 
 class Environment(object):
@@ -128,14 +436,23 @@ class Environment(object):
          Percept: Define a percepção que um agente vê.
          Execute_action: Define os efeitos da execução de uma ação. Atualize também o slot agent.performance.
 
-     O ambiente mantém uma lista de .things e .agents (que é um subconjunto
-     das coisas). Cada agente tem um slot de desempenho, inicializado a 0.
-     Cada coisa tem um slot de localização, mesmo que alguns ambientes não
-     precisem disso."""
+     O ambiente mantém uma coleção de .things e .agents (que é um subconjunto
+     das coisas), ambas ThingRegistry. Cada agente tem um slot de desempenho,
+     inicializado a 0. Cada coisa tem um slot de localização, mesmo que alguns
+     ambientes não precisem disso. Um índice espacial (localização -> classe -> coisas)
+     é mantido por add_thing, delete_thing e pelas mudanças de .location,
+     para que list_things_at e some_things_at não percorram todas as coisas."""
+
+    # Instrumentação opcional dos passos (veja StepMonitor)
+    monitor = None
+
+    # Número de agentes com programa batchable, mantido por add_thing e delete_thing
+    _batchable = 0
 
     def __init__(self):
-        self.things = []
-        self.agents = []
+        self.things = ThingRegistry()
+        self.agents = ThingRegistry()
+        self._index = {}
 
     # lista de classes do ambiente
     def thing_classes(self):
@@ -151,6 +468,17 @@ class Environment(object):
         "Altera o mundo (ambiente)"
         raise NotImplementedError
 
+    def percepts_batch(self, agents):
+        """Retorna as percepções de vários agentes de uma vez. Ambientes com muitos agentes
+         podem substituir este método para calcular todas juntas (ex.: com NumPy)."""
+        return [self.percept(agent) for agent in agents]
+
+    def execute_actions_batch(self, agents, actions):
+        """Executa as ações de vários agentes, na ordem. Assim como percepts_batch,
+         pode ser substituído por uma versão vetorizada."""
+        for (agent, action) in zip(agents, actions):
+            self.execute_action(agent, action)
+
     def default_location(self, thing):
         "Localização padrão para colocar uma nova Coisa."
         return None
@@ -166,6 +494,9 @@ class Environment(object):
     def step(self):
         """Executar o ambiente para um passo de tempo."""
         if not self.is_done():
+            if self.monitor is not None or self._batchable:
+                self.step_batch()
+                return
             actions = []
             for agent in self.agents:
                 if agent.alive:
@@ -176,6 +507,82 @@ class Environment(object):
                 self.execute_action(agent, action)
             self.exogenous_change()
 
+    def step_batch(self):
+        """Um passo de tempo em que os agentes vivos que compartilham um programa marcado com
+         batchable são atendidos por uma única chamada ao programa, com as percepções de
+         percepts_batch. Os demais agentes continuam recebendo uma percepção por vez.
+         Agentes mortos fazem a ação "", como em step. Também é o passo usado por step
+         quando há um monitor."""
+        for _ in self._step_routine(asynchronous=False):
+            pass
+
+    def _step_routine(self, asynchronous):
+        """Corpo comum de step_batch e step_async. É um gerador: com asynchronous, se algum
+         programa retornar um awaitable, cede a lista de (índices, batched, awaitable)
+         pendentes e recebe, por send, um par (respondeu, resultado) para cada um, na mesma
+         ordem. Com self.monitor, mede cada fase e registra o passo no monitor."""
+        monitor = self.monitor
+        timed = monitor is not None
+        clock = time.perf_counter
+        timings = dict.fromkeys(StepMonitor.PHASES, 0.0)
+        agents = list(self.agents)
+        alive = [agent.alive for agent in agents]
+        percepts = [None] * len(agents)
+        actions = [""] * len(agents)
+        groups = collections.OrderedDict()
+        pending = []
+        for i, agent in enumerate(agents):
+            if not alive[i]:
+                continue
+            if getattr(agent.program, 'batchable', False):
+                groups.setdefault(agent.program, []).append(i)
+                continue
+            if timed:
+                start = clock()
+                percepts[i] = self.percept(agent)
+                middle = clock()
+                action = agent.program(percepts[i])
+                timings['percept'] += middle - start
+                timings['program'] += clock() - middle
+            else:
+                action = agent.program(self.percept(agent))
+            if asynchronous and inspect.isawaitable(action):
+                pending.append(([i], False, action))
+            else:
+                actions[i] = action
+        for program, indices in groups.items():
+            start = clock()
+            batch = self.percepts_batch([agents[i] for i in indices])
+            middle = clock()
+            result = program(batch)
+            timings['percept'] += middle - start
+            timings['program'] += clock() - middle
+            for i, percept in zip(indices, batch):
+                percepts[i] = percept
+            if asynchronous and inspect.isawaitable(result):
+                pending.append((indices, True, result))
+            else:
+                for i, action in zip(indices, result):
+                    actions[i] = action
+        if pending:
+            results = yield pending
+            for (indices, batched, awaitable), (answered, result) in zip(pending, results):
+                if answered:
+                    for i, action in zip(indices, result if batched else [result]):
+                        actions[i] = action
+        start = clock()
+        if groups:
+            self.execute_actions_batch(agents, actions)
+        else:
+            for (agent, action) in zip(agents, actions):
+                self.execute_action(agent, action)
+        middle = clock()
+        self.exogenous_change()
+        timings['execute_action'] = middle - start
+        timings['exogenous_change'] = clock() - middle
+        if monitor is not None:
+            monitor.record(agents, alive, percepts, actions, timings)
+
     def run(self, steps=1000):
         "Execute o ambiente para determinado número de etapas de tempo."
         for step in range(steps):
@@ -183,15 +590,72 @@ class Environment(object):
                 return
             self.step()
 
+    async def step_async(self, timeout=None):
+        """O mesmo que step, mas programas de agentes podem retornar um awaitable (ex.: funções
+         async def), que é aguardado junto com os dos outros agentes. Um programa que não
+         responde em timeout segundos faz a ação "" neste passo (com batchable, todos os
+         agentes do grupo). O cancelamento da tarefa é propagado aos programas pendentes."""
+        if self.is_done():
+            return
+        routine = self._step_routine(asynchronous=True)
+        pending = next(routine, None)
+        if pending is None:
+            return
+        results = await asyncio.gather(*(_await_action(awaitable, timeout)
+                                          for indices, batched, awaitable in pending))
+        try:
+            routine.send(results)
+        except StopIteration:
+            pass
+
+    async def run_async(self, steps=1000, timeout=None):
+        """Versão assíncrona de run, com o mesmo critério de parada (is_done).
+         timeout é o limite, em segundos, para cada programa em cada passo."""
+        for step in range(steps):
+            if self.is_done():
+                return
+            await self.step_async(timeout)
+            # Cede a vez aos outros ambientes mesmo quando nenhum programa é assíncrono
+            await asyncio.sleep(0)
+
     def list_things_at(self, location, tclass=Thing):
         "Devolva todas as coisas exatamente em um determinado local."
-        return [thing for thing in self.things
-                if thing.location == location and isinstance(thing, tclass)]
+        buckets = self._index.get(location)
+        if not buckets:
+            return []
+        things = [thing for cls, bucket in buckets.items() if issubclass(cls, tclass)
+                  for thing in bucket]
+        # Mesma ordem de self.things
+        if len(things) > 1:
+            things.sort(key=self.things.position)
+        return things
 
     def some_things_at(self, location, tclass=Thing):
         """Retorna true se pelo menos uma das coisas no local
          for uma instância de classe tclass (ou uma subclasse)."""
-        return self.list_things_at(location, tclass) != []
+        buckets = self._index.get(location)
+        return bool(buckets) and any(issubclass(cls, tclass) for cls in buckets)
+
+    def _index_thing(self, thing):
+        "Insere a coisa no índice espacial, no grupo da sua localização e classe."
+        buckets = self._index.setdefault(thing.location, {})
+        bucket = buckets.get(type(thing))
+        if bucket is None:
+            bucket = buckets[type(thing)] = ThingRegistry()
+        bucket.append(thing)
+
+    def _unindex_thing(self, thing):
+        "Remove a coisa do índice espacial, descartando grupos vazios."
+        buckets = self._index.get(thing.location)
+        if buckets is None:
+            return
+        bucket = buckets.get(type(thing))
+        if bucket is not None:
+            bucket.discard(thing)
+            if not bucket:
+                del buckets[type(thing)]
+                if not buckets:
+                    del self._index[thing.location]
 
     def add_thing(self, thing, location=None):
         """Adicione uma coisa ao ambiente, definindo sua localização. Para
@@ -202,9 +666,13 @@ class Environment(object):
         assert thing not in self.things, "Don't add the same thing twice"
         thing.location = location if location is not None else self.default_location(thing)
         self.things.append(thing)
+        thing._envs = getattr(thing, '_envs', ()) + (self,)
+        self._index_thing(thing)
         if isinstance(thing, Agent):
             thing.performance = 0
             self.agents.append(thing)
+            if getattr(thing.program, 'batchable', False):
+                self._batchable += 1
 
     def delete_thing(self, thing):
         """Remove uma coisa no ambiente."""
@@ -215,80 +683,262 @@ class Environment(object):
             print("  in Environment delete_thing")
             print("  Thing to be removed: {} at {}" .format(thing, thing.location))
             print("  from list: {}" .format([(thing, thing.location) for thing in self.things]))
+        else:
+            self._unindex_thing(thing)
+            thing._envs = tuple(env for env in thing._envs if env is not self)
         if thing in self.agents:
             self.agents.remove(thing)
+            if getattr(thing.program, 'batchable', False):
+                self._batchable -= 1
+
+    def snapshot(self):
+        """Retorna o estado do ambiente serializado com pickle. Environment.restore cria
+        cópias independentes a partir dele bem mais rápido que copy.deepcopy. Se algo
+        no ambiente não puder ser serializado (ex.: programas de agentes que são closures),
+        retorna uma cópia congelada do ambiente, e restore recorre a deepcopy."""
+        try:
+            return pickle.dumps(self, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return copy.deepcopy(self)
+
+    @staticmethod
+    def restore(snapshot):
+        "Cria um novo ambiente a partir de um snapshot."
+        if isinstance(snapshot, bytes):
+            return pickle.loads(snapshot)
+        return copy.deepcopy(snapshot)
+
+    def clone(self):
+        "Retorna uma cópia independente do ambiente."
+        return Environment.restore(self.snapshot())
 
 class Direction():
-    '''Uma classe de direção para agentes que querem mover-se em um plano 2D'''
+    '''Uma classe de direção para agentes que querem mover-se em um plano 2D.
+    Cada direção é um objeto único (Direction("right") retorna sempre a mesma
+    instância), com um índice inteiro usado nas tabelas de giro e de movimento,
+    então girar e andar não criam objetos novos. As instâncias não devem ser alteradas.'''
+
+    __slots__ = ('direction', 'index')
 
     R = "right"
     L = "left"
     U = "up"
     D = "down"
 
-    def __init__(self, direction):
-        self.direction = direction
+    _instances = {}
+
+    def __new__(cls, direction):
+        try:
+            return cls._instances[direction]
+        except (KeyError, TypeError):
+            self = object.__new__(cls)
+            self.direction = direction
+            # Direções desconhecidas não têm índice: girar e andar retornam None
+            self.index = None
+            return self
 
     def __add__(self, heading):
-        if self.direction == self.R:
-            return{
-                self.R: Direction(self.D),
-                self.L: Direction(self.U),
-            }.get(heading, None)
-        elif self.direction == self.L:
-            return{
-                self.R: Direction(self.U),
-                self.L: Direction(self.L),
-            }.get(heading, None)
-        elif self.direction == self.U:
-            return{
-                self.R: Direction(self.R),
-                self.L: Direction(self.L),
-            }.get(heading, None)
-        elif self.direction == self.D:
-            return{
-                self.R: Direction(self.L),
-                self.L: Direction(self.R),
-            }.get(heading, None)
+        if self.index is not None:
+            return self._turns[self.index].get(heading, None)
 
     def move_forward(self, from_location):
         x, y = from_location
-        if self.direction == self.R:
-            return (x+1, y)
-        elif self.direction == self.L:
-            return (x-1, y)
-        elif self.direction == self.U:
-            return (x, y-1)
-        elif self.direction == self.D:
-            return (x, y+1)
+        if self.index is not None:
+            dx, dy = self._moves[self.index]
+            return (x + dx, y + dy)
+
+    def __reduce__(self):
+        # Cópias e pickle voltam para a instância única da direção
+        return (Direction, (self.direction,))
+
+
+def _intern_directions():
+    "Cria as instâncias únicas das quatro direções e as tabelas de giro e de movimento."
+    for index, direction in enumerate((Direction.R, Direction.L, Direction.U, Direction.D)):
+        Direction._instances[direction] = Direction(direction)
+        Direction._instances[direction].index = index
+
+    # Giros a partir de cada direção, na ordem dos índices (R, L, U, D)
+    Direction._turns = tuple({Direction.R: Direction(right), Direction.L: Direction(left)}
+                             for right, left in ((Direction.D, Direction.U),
+                                                 (Direction.U, Direction.L),
+                                                 (Direction.R, Direction.L),
+                                                 (Direction.L, Direction.R)))
+    Direction._moves = ((1, 0), (-1, 0), (0, -1), (0, 1))
+
+
+_intern_directions()
 
 
 class Obstacle(Thing):
 
     """Algo que pode causar um impacto, impedindo um agente de
      mover-se para o mesmo espaço em que está."""
-    pass
+    __slots__ = ()
 
 
 class Wall(Obstacle):
-    pass
+    __slots__ = ()
+
 
+async def _await_action(awaitable, timeout):
+    "Aguarda a ação de um programa; retorna (False, None) se o tempo acabar."
+    try:
+        return True, await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        return False, None
 
-def compare_agents(EnvFactory, AgentFactories, n=10, steps=1000):
-    """Compara vários agentes em n instâncias de um ambiente."""
+
+async def run_many_async(envs, steps=1000, timeout=None):
+    """Executa vários ambientes concorrentemente, cada um por até `steps` passos
+    (veja Environment.run_async). Uso: asyncio.run(run_many_async(envs)).
+    Se a tarefa for cancelada, todos os ambientes param."""
+    await asyncio.gather(*(env.run_async(steps, timeout) for env in envs))
+
+
+def compare_agents(EnvFactory, AgentFactories, n=10, steps=1000, workers=None, seed=None):
+    """Compara vários agentes em n instâncias de um ambiente.
+    Com workers, as tentativas são distribuídas entre processos (veja run_trials)."""
     envs = [EnvFactory() for i in range(n)]
-    return [(A, test_agent(A, steps, copy.deepcopy(envs)))
+    if workers is None and seed is None:
+        snapshots = [env.snapshot() for env in envs]
+        return [(A, test_agent(A, steps, [Environment.restore(s) for s in snapshots]))
+                for A in AgentFactories]
+    trials = run_trials(AgentFactories, steps, envs, workers, seed)
+    return [(A, mean(t.score for t in trials if t.agent is A))
             for A in AgentFactories]
 
 
-def test_agent(AgentFactory, steps, envs):
+def test_agent(AgentFactory, steps, envs, workers=None, seed=None):
     "Retornar a pontuação média de execução de um agente em cada um dos ambientes, para as etapas"
-    def score(env):
-        agent = AgentFactory()
-        env.add_thing(agent)
-        env.run(steps)
-        return agent.performance
-    return mean(map(score, envs))
-
-
+    if workers is None and seed is None:
+        def score(env):
+            agent = AgentFactory()
+            env.add_thing(agent)
+            env.run(steps)
+            return agent.performance
+        return mean(map(score, envs))
+    return mean(t.score for t in run_trials([AgentFactory], steps, envs, workers, seed, copy_envs=False))
+
+
+# Resultado de uma tentativa: fábrica do agente, índice do ambiente, pontuação e tempo de execução (s)
+Trial = collections.namedtuple('Trial', ['agent', 'env', 'score', 'seconds'])
+
+
+def run_trials(AgentFactories, steps, envs, workers=None, seed=None, copy_envs=True):
+    """Executa cada fábrica de agente em cada ambiente e retorna um Trial por tentativa,
+    na ordem (agente, ambiente). Com workers, as tentativas são distribuídas entre
+    processos, e cada uma roda em uma cópia do seu ambiente. Com seed, a tentativa k
+    usa random.seed(seed + k), então os resultados não dependem do número de processos.
+    Os processos são criados com fork, quando a plataforma oferece, e herdam fábricas e
+    ambientes sem pickle. Sem fork (Windows), as fábricas e os ambientes precisam ser
+    serializáveis com pickle (funções de módulo, não lambdas nem closures).
+    Com copy_envs=False, cada ambiente recebe uma única tentativa e é usado sem cópia
+    (nos processos, a cópia é a do próprio fork)."""
+    if workers is None:
+        snapshots = [env.snapshot() for env in envs] if copy_envs else None
+        trials = []
+        for a, A in enumerate(AgentFactories):
+            instances = [Environment.restore(s) for s in snapshots] if copy_envs else envs
+            for i, env in enumerate(instances):
+                trial_seed = None if seed is None else seed + a * len(envs) + i
+                trials.append(Trial(A, i, *_run_trial(A, env, steps, trial_seed)))
+        return trials
+    sources = [env.snapshot() for env in envs] if copy_envs else envs
+    jobs = [(a, i) for a in range(len(AgentFactories)) for i in range(len(envs))]
+    with _pool_context().Pool(workers, _init_trial_worker,
+                                    ((AgentFactories, sources, copy_envs, steps, seed),)) as pool:
+        results = pool.map(_trial_worker, jobs)
+    return [Trial(AgentFactories[a], i, score, seconds) for a, i, score, seconds in results]
+
+
+def _run_trial(AgentFactory, env, steps, seed):
+    "Executa um agente novo no ambiente e retorna (pontuação, segundos)."
+    if seed is not None:
+        random.seed(seed)
+    start = time.perf_counter()
+    agent = AgentFactory()
+    env.add_thing(agent)
+    env.run(steps)
+    return agent.performance, time.perf_counter() - start
+
+
+def _pool_context():
+    "Contexto de multiprocessing das tentativas: fork quando disponível, senão o padrão."
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return multiprocessing.get_context()
+
+
+_trial_context = None
+
+
+def _init_trial_worker(context):
+    global _trial_context
+    _trial_context = context
+
+
+def _trial_worker(job):
+    a, i = job
+    AgentFactories, sources, copy_envs, steps, seed = _trial_context
+    trial_seed = None if seed is None else seed + a * len(sources) + i
+    env = Environment.restore(sources[i]) if copy_envs else sources[i]
+    return (a, i) + _run_trial(AgentFactories[a], env, steps, trial_seed)
+
+
+def benchmark_cloning(EnvFactory, n=10, agents=10):
+    """Compara copy.deepcopy com snapshot/restore para recriar n ambientes para cada um
+    de `agents` agentes, como em compare_agents: tempo total e pico de memória."""
+    envs = [EnvFactory() for i in range(n)]
 
+    def deepcopies():
+        for a in range(agents):
+            copies = copy.deepcopy(envs)
+
+    def restores():
+        snapshots = [env.snapshot() for env in envs]
+        for a in range(agents):
+            copies = [Environment.restore(s) for s in snapshots]
+
+    results = {}
+    for name, clone in (('deepcopy', deepcopies), ('snapshot', restores)):
+        start = time.perf_counter()
+        clone()
+        seconds = time.perf_counter() - start
+
+        # O pico de memória é medido numa segunda execução, pois o tracemalloc distorce o tempo
+        tracemalloc.start()
+        clone()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = (seconds, peak)
+        print('{:10} {:8.3f} s  pico de memória {:8.1f} KB'.format(name, seconds, peak / 1024))
+    return results
+
+
+
+def benchmark_agents(n=100000, turns=1000000):
+    """Mede a memória por agente (bytes alocados, via tracemalloc, para criar n agentes
+    com o mesmo programa) e a velocidade de Direction: giros e passos por segundo."""
+    program = RandomAgentProgram(['Right', 'Left'])
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    agents = [Agent(program) for i in range(n)]
+    per_agent = (tracemalloc.get_traced_memory()[0] - before) / n
+    tracemalloc.stop()
+    del agents
+    print('{:10} {:8.1f} bytes/agente'.format('Agent', per_agent))
+
+    direction = Direction(Direction.R)
+    start = time.perf_counter()
+    for i in range(turns):
+        direction = direction + Direction.R
+    turns_per_second = turns / (time.perf_counter() - start)
+    location = (0, 0)
+    start = time.perf_counter()
+    for i in range(turns):
+        location = direction.move_forward(location)
+    moves_per_second = turns / (time.perf_counter() - start)
+    print('{:10} {:12.0f} giros/s  {:12.0f} passos/s'.format('Direction', turns_per_second, moves_per_second))
+    return per_agent, turns_per_second, moves_per_second
@@ -24,6 +24,13 @@
 # Uma pergunta filosófica interessante: se não há ninguém para desafiá-lo, você pode alcançar seu potencial máximo?
 
 # Imports
+import os
+import sys
+import json
+import time
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
 import numpy as np
 import matplotlib.pyplot as plt
 from builtins import range, input
@@ -31,9 +38,67 @@ from builtins import range, input
 # Variável para ajudar a definir o total de estados possíveis
 LENGTH = 3
 
+# Potências de 3 pré-calculadas, usadas para atualizar o hash do estado a cada movimento
+POW3 = [3**k for k in range(LENGTH*LENGTH)]
+POW3_ARRAY = np.array(POW3, dtype=np.int64)
+
+# Máscaras de bits das linhas vencedoras (linhas, colunas e as duas diagonais), bit k = célula i*LENGTH + j
+WIN_MASKS = (
+    [sum(1 << (i*LENGTH + j) for j in range(LENGTH)) for i in range(LENGTH)] +
+    [sum(1 << (i*LENGTH + j) for i in range(LENGTH)) for j in range(LENGTH)] +
+    [sum(1 << (i*LENGTH + i) for i in range(LENGTH)),
+     sum(1 << (i*LENGTH + LENGTH - 1 - i) for i in range(LENGTH))]
+)
+
+# Máscara com todas as células ocupadas, usada para detectar empate
+FULL_MASK = (1 << (LENGTH*LENGTH)) - 1
+
+# Células vazias (índices k em ordem crescente) para cada máscara de células ocupadas do bitboard
+EMPTY_CELLS = [np.array([k for k in range(LENGTH*LENGTH) if not mask >> k & 1], dtype=np.int64)
+               for mask in range(FULL_MASK + 1)]
+
+# Arquivo de cache das tabelas de estados terminais (vencedor e fim de jogo de cada estado)
+TERMINAL_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'terminal_%d.npz' % LENGTH)
+
+# Versão do formato dos checkpoints de V (<path>.npy + <path>.json)
+CHECKPOINT_VERSION = 1
+
+# As 8 simetrias do tabuleiro (grupo D4: 4 rotações e suas reflexões), como funções (i, j) -> (i', j')
+SYMMETRIES = (
+    lambda i, j: (i, j),
+    lambda i, j: (j, LENGTH - 1 - i),
+    lambda i, j: (LENGTH - 1 - i, LENGTH - 1 - j),
+    lambda i, j: (LENGTH - 1 - j, i),
+    lambda i, j: (i, LENGTH - 1 - j),
+    lambda i, j: (LENGTH - 1 - i, j),
+    lambda i, j: (j, i),
+    lambda i, j: (LENGTH - 1 - j, LENGTH - 1 - i),
+)
+
+# Tabela canonical[state] -> representante do estado (menor hash entre as 8 simetrias), calculada uma única vez
+_canonical_table = None
+
+def get_canonical_table():
+    global _canonical_table
+    if _canonical_table is None:
+        pow3 = np.array(POW3, dtype=np.int64)
+        states = np.arange(3**(LENGTH*LENGTH), dtype=np.int64)
+
+        # Dígito base-3 de cada célula de cada estado
+        digits = states[:, None] // pow3[None, :] % 3
+
+        canonical = states.copy()
+        for f in SYMMETRIES:
+            # A célula k vai para a célula f(k) no tabuleiro transformado
+            target = [f(k // LENGTH, k % LENGTH) for k in range(LENGTH*LENGTH)]
+            target = np.array([i*LENGTH + j for i, j in target])
+            canonical = np.minimum(canonical, digits @ pow3[target])
+        _canonical_table = canonical
+    return _canonical_table
+
 # Classe Agente
 class Agent:
-    def __init__(self, eps=0.1, alpha=0.5):
+    def __init__(self, eps=0.1, alpha=0.5, canonical=False):
 
         # Probabilidade de escolher uma ação aleatória em vez de gananciosa
         self.eps = eps
@@ -41,6 +106,9 @@ class Agent:
         # Learning rate
         self.alpha = alpha
 
+        # Se canonical, as 8 simetrias de uma posição compartilham a mesma entrada de V
+        self.canonical = get_canonical_table() if canonical else None
+
         self.verbose = False
         self.state_history = []
 
@@ -57,48 +125,65 @@ class Agent:
     def reset_history(self):
         self.state_history = []
 
+    def key(self, state):
+        # Índice de V usado para o estado: o próprio hash ou o seu representante canônico
+        return state if self.canonical is None else self.canonical[state]
+
+    def save(self, path, episodes=0, background=False):
+        # Salva V como checkpoint versionado: <path>.npy com a tabela e <path>.json com os metadados
+        # Com background=True, uma cópia de V é gravada em outra thread e o treinamento não pausa
+        V = np.array(self.V)
+        meta = {'version': CHECKPOINT_VERSION, 'length': LENGTH, 'num_states': len(V),
+                'canonical': self.canonical is not None, 'episodes': episodes}
+        if not background:
+            write_checkpoint(path, V, meta)
+            return None
+        thread = threading.Thread(target=write_checkpoint, args=(path, V, meta))
+        thread.start()
+        return thread
+
+    def load(self, path, mmap=False):
+        # Carrega V de um checkpoint e retorna o número de episódios já treinados
+        # Com mmap=True a tabela é mapeada do disco (cópia na escrita), então o agente fica pronto instantaneamente
+        V, meta = read_checkpoint(path, mmap)
+        self.canonical = get_canonical_table() if meta['canonical'] else None
+        self.setV(V)
+        return meta['episodes']
+
+    def successor_values(self, state, cells, code, pow3=POW3_ARRAY):
+        # Valor de V para cada movimento possível: o hash do sucessor é state + 3^k * código da célula k,
+        # calculado diretamente do hash atual, sem alterar o tabuleiro
+        successors = state + pow3[cells] * code
+        if isinstance(self.V, LazyValueTable):
+            # V esparso (tabuleiros m,n,k): um acesso ao dicionário por sucessor
+            return np.array([self.V[s] for s in successors.tolist()])
+        return self.V[self.key(successors)]
+
     def take_action(self, env):
         # Escolhe uma ação baseada na estratégia epsilon-gananciosa
         r = np.random.rand()
-        best_state = None
+
+        # Células vazias (k = i*cols + j), na mesma ordem em que o tabuleiro é percorrido
+        cells = env.empty_cells()
         if r < self.eps:
             # Toma uma ação aleatória
             if self.verbose:
                 print("Tomando uma ação aleatória")
 
-            possible_moves = []
-            for i in range(LENGTH):
-                for j in range(LENGTH):
-                    if env.is_empty(i, j):
-                        possible_moves.append((i, j))
-            idx = np.random.choice(len(possible_moves))
-            next_move = possible_moves[idx]
+            idx = np.random.choice(len(cells))
         else:
-            # Escolha a melhor ação com base nos valores atuais de estados,
-            # faz um loop em todos os movimentos possíveis,
-            # obtém seus valores para acompanhar o melhor valor
-            pos2value = {}
-            next_move = None
-            best_value = -1
-            for i in range(LENGTH):
-                for j in range(LENGTH):
-                    if env.is_empty(i, j):
-                        # Qual é o estado se fizermos esse movimento?
-                        env.board[i,j] = self.sym
-                        state = env.get_state()
-                        env.board[i,j] = 0
-                        pos2value[(i,j)] = self.V[state]
-                        if self.V[state] > best_value:
-                            best_value = self.V[state]
-                            best_state = state
-                            next_move = (i, j)
+            # Escolha a melhor ação com base nos valores atuais de estados:
+            # um único acesso vetorizado a V obtém o valor de todos os movimentos possíveis
+            values = self.successor_values(env.get_state(), cells, env.code[self.sym], env.pow3)
+            idx = values.argmax()
 
             # Se verbose, desenhe o tabuleiro com os valores
             if self.verbose:
+                pos2value = {divmod(k, env.cols): v for k, v in zip(cells, values)}
                 print("Tomando uma ação gananciosa")
-                for i in range(LENGTH):
-                    print("------------------")
-                    for j in range(LENGTH):
+                for i in range(env.rows):
+                    print("------" * env.cols)
+                    for j in range(env.cols):
                         if env.is_empty(i, j):
                             # Imprime o valor
                             print(" %.2f|" % pos2value[(i,j)], end="")
@@ -111,10 +196,11 @@ class Agent:
                             else:
                                 print("   |", end="")
                     print("")
-                print("------------------")
+                print("------" * env.cols)
 
         # Faz o movimento
-        env.board[next_move[0], next_move[1]] = self.sym
+        i, j = divmod(cells[idx], env.cols)
+        env.place(i, j, self.sym)
 
     def update_state_history(self, s):
         # Não pode colocar isso em take_action, porque take_action só acontece uma vez a cada outra iteração
@@ -133,6 +219,7 @@ class Agent:
         reward = env.reward(self.sym)
         target = reward
         for prev in reversed(self.state_history):
+            prev = self.key(prev)
             value = self.V[prev] + self.alpha*(target - self.V[prev])
             self.V[prev] = value
             target = value
@@ -143,8 +230,11 @@ class Agent:
 class Environment:
 
     # Construtor
-    def __init__(self):
+    # terminal: tupla (winner, ended) de load_terminal_tables; se fornecida, game_over consulta a tabela pelo hash
+    def __init__(self, terminal=None):
         self.board = np.zeros((LENGTH, LENGTH))
+        self.rows = self.cols = LENGTH
+        self.pow3 = POW3_ARRAY
 
         # Representa um x no tabuleiro, jogador 1
         self.x = -1
@@ -152,13 +242,24 @@ class Environment:
         # Representa um o no tabuleiro, jogador 2
         self.o = 1
 
+        # Valor de cada célula na representação base-3 do estado: vazio = 0, x = 1, o = 2
+        self.code = {0: 0, self.x: 1, self.o: 2}
+
+        # Hash do estado atual, mantido incrementalmente por place e undo
+        self.hash = 0
+
         self.winner = None
         self.ended = False
         self.num_states = 3**(LENGTH*LENGTH)
+        self.terminal = terminal
 
     def is_empty(self, i, j):
         return self.board[i,j] == 0
 
+    def empty_cells(self):
+        # Índices k = i*LENGTH + j das células vazias
+        return np.flatnonzero(self.board.ravel() == 0)
+
     def reward(self, sym):
         # Sem recompensa até terminar o jogo
         if not self.game_over():
@@ -167,23 +268,22 @@ class Environment:
         # Se chegamos aqui, game is over
         return 1 if self.winner == sym else 0
 
+    def place(self, i, j, sym):
+        # Coloca o símbolo na célula (i, j) e soma sua contribuição ao hash: 3^k * código, com k = i*LENGTH + j
+        self.board[i,j] = sym
+        self.hash += POW3[i*LENGTH + j] * self.code[sym]
+
+    def undo(self, i, j):
+        # Esvazia a célula (i, j) e subtrai do hash a contribuição do símbolo que estava nela
+        self.hash -= POW3[i*LENGTH + j] * self.code[self.board[i,j]]
+        self.board[i,j] = 0
+
     def get_state(self):
         # Retorna o estado atual, representado como um int de 0 ... | S | -1, onde S = conjunto de todos os estados possíveis
         # | S | = 3 ^ (TAMANHO DO TABULEIRO), uma vez que cada célula pode ter 3 valores possíveis - vazio, x, o - alguns estados não são possíveis,
         # p. Ex. todas as células são x, mas ignoramos esse detalhe, é como encontrar o número inteiro representado por um número base-3
-        k = 0
-        h = 0
-        for i in range(LENGTH):
-            for j in range(LENGTH):
-                if self.board[i,j] == 0:
-                    v = 0
-                elif self.board[i,j] == self.x:
-                    v = 1
-                elif self.board[i,j] == self.o:
-                    v = 2
-                h += (3**k) * v
-                k += 1
-        return h
+        # O hash não é recalculado aqui: place e undo o mantêm atualizado a cada movimento
+        return self.hash
 
     def game_over(self, force_recalculate=False):
         # Retorna verdadeiro se o jogo acabou (um jogador ganhou ou é um empate), de outra forma, retorna falso
@@ -191,6 +291,10 @@ class Environment:
         if not force_recalculate and self.ended:
             return self.ended
 
+        # Com a tabela de estados terminais, basta um acesso indexado pelo hash
+        if not force_recalculate and self.terminal is not None:
+            return lookup_terminal(self)
+
         # Verifica se há vencedor
 
         # Checa as linhas
@@ -258,6 +362,261 @@ class Environment:
         print("-------------")
 
 
+# Classe Ambiente com tabuleiro em bitboard
+# Cada jogador é representado por um inteiro de 9 bits (bit k = célula i*LENGTH + j),
+# o que evita as reduções NumPy de game_over em arrays minúsculos.
+# Oferece a mesma interface de Environment, então Agent, Human e play_game funcionam sem alterações.
+class BitboardEnvironment:
+
+    # Construtor
+    def __init__(self, terminal=None):
+        # Bits ocupados por x (jogador 1) e por o (jogador 2)
+        self.x_bits = 0
+        self.o_bits = 0
+        self.rows = self.cols = LENGTH
+        self.pow3 = POW3_ARRAY
+
+        self.x = -1
+        self.o = 1
+        self.code = {0: 0, self.x: 1, self.o: 2}
+        self.hash = 0
+
+        self.winner = None
+        self.ended = False
+        self.num_states = 3**(LENGTH*LENGTH)
+        self.terminal = terminal
+
+    @property
+    def board(self):
+        # Tabuleiro no formato de Environment, montado a partir dos bits (usado apenas para exibição)
+        board = np.zeros((LENGTH, LENGTH))
+        for k in range(LENGTH*LENGTH):
+            if self.x_bits >> k & 1:
+                board[k // LENGTH, k % LENGTH] = self.x
+            elif self.o_bits >> k & 1:
+                board[k // LENGTH, k % LENGTH] = self.o
+        return board
+
+    def is_empty(self, i, j):
+        return not (self.x_bits | self.o_bits) >> (i*LENGTH + j) & 1
+
+    def empty_cells(self):
+        return EMPTY_CELLS[self.x_bits | self.o_bits]
+
+    def place(self, i, j, sym):
+        k = i*LENGTH + j
+        if sym == self.x:
+            self.x_bits |= 1 << k
+        else:
+            self.o_bits |= 1 << k
+        self.hash += POW3[k] * self.code[sym]
+
+    def undo(self, i, j):
+        k = i*LENGTH + j
+        if self.x_bits >> k & 1:
+            self.x_bits &= ~(1 << k)
+            self.hash -= POW3[k] * self.code[self.x]
+        elif self.o_bits >> k & 1:
+            self.o_bits &= ~(1 << k)
+            self.hash -= POW3[k] * self.code[self.o]
+
+    def reward(self, sym):
+        if not self.game_over():
+            return 0
+        return 1 if self.winner == sym else 0
+
+    def get_state(self):
+        return self.hash
+
+    def game_over(self, force_recalculate=False):
+        # Mesma semântica de Environment.game_over, mas cada linha é um único AND com a máscara
+        if not force_recalculate and self.ended:
+            return self.ended
+
+        if not force_recalculate and self.terminal is not None:
+            return lookup_terminal(self)
+
+        for mask in WIN_MASKS:
+            for player, bits in ((self.x, self.x_bits), (self.o, self.o_bits)):
+                if bits & mask == mask:
+                    self.winner = player
+                    self.ended = True
+                    return True
+
+        # Checa se é empate
+        if self.x_bits | self.o_bits == FULL_MASK:
+            self.winner = None
+            self.ended = True
+            return True
+
+        self.winner = None
+        return False
+
+    def is_draw(self):
+        return self.ended and self.winner is None
+
+    def draw_board(self):
+        for i in range(LENGTH):
+            print("-------------")
+            for j in range(LENGTH):
+                print("  ", end="")
+                k = i*LENGTH + j
+                if self.x_bits >> k & 1:
+                    print("x ", end="")
+                elif self.o_bits >> k & 1:
+                    print("o ", end="")
+                else:
+                    print("  ", end="")
+            print("")
+        print("-------------")
+
+
+# Potências de 3 de um tabuleiro m,n,k, calculadas uma vez por número de células
+# Acima de 3^39 o int64 transborda e são usados os inteiros do Python
+_mnk_powers = {}
+
+def mnk_powers(n):
+    if n not in _mnk_powers:
+        _mnk_powers[n] = np.array([3**c for c in range(n)], dtype=np.int64 if n < 40 else object)
+    return _mnk_powers[n]
+
+
+# Classe Ambiente m,n,k: tabuleiro com rows linhas e cols colunas, vence quem alinhar k símbolos
+# O estado continua sendo o número base-3 das células (inteiro Python, sem limite de tamanho) e a vitória
+# é verificada de forma incremental em place, apenas nas 4 linhas que passam pela última jogada.
+# Oferece a mesma interface de Environment; os valores dos agentes ficam em LazyValueTable.
+class MNKEnvironment:
+
+    # Direções das linhas que passam por uma célula: horizontal, vertical e as duas diagonais
+    DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+    # Construtor
+    def __init__(self, rows=LENGTH, cols=LENGTH, k=LENGTH):
+        self.rows = rows
+        self.cols = cols
+        self.k = k
+        self.cells = [0] * (rows*cols)
+        self.moves = 0
+
+        self.pow3 = mnk_powers(rows*cols)
+
+        self.x = -1
+        self.o = 1
+        self.code = {0: 0, self.x: 1, self.o: 2}
+        self.hash = 0
+
+        self.winner = None
+        self.ended = False
+        self.num_states = 3**(rows*cols)
+
+    @property
+    def board(self):
+        return np.array(self.cells, dtype=float).reshape(self.rows, self.cols)
+
+    def is_empty(self, i, j):
+        return self.cells[i*self.cols + j] == 0
+
+    def empty_cells(self):
+        return np.array([c for c, v in enumerate(self.cells) if v == 0], dtype=np.int64)
+
+    def line_length(self, cells, i, j, di, dj):
+        # Número de símbolos iguais ao da célula (i, j) em sequência na direção (di, dj), incluindo ela
+        sym = cells[i*self.cols + j]
+        n = 0
+        while 0 <= i < self.rows and 0 <= j < self.cols and cells[i*self.cols + j] == sym:
+            n += 1
+            i += di
+            j += dj
+        return n
+
+    def place(self, i, j, sym):
+        c = i*self.cols + j
+        self.cells[c] = sym
+        self.hash += int(self.pow3[c]) * self.code[sym]
+        self.moves += 1
+
+        # Só as linhas que passam por (i, j) podem ter sido completadas por esta jogada
+        for di, dj in self.DIRECTIONS:
+            if self.line_length(self.cells, i, j, di, dj) + self.line_length(self.cells, i, j, -di, -dj) - 1 >= self.k:
+                self.winner = sym
+                self.ended = True
+                return
+        if self.moves == self.rows*self.cols:
+            self.ended = True
+
+    def undo(self, i, j):
+        # Desfazer sempre volta a uma posição não terminal
+        c = i*self.cols + j
+        self.hash -= int(self.pow3[c]) * self.code[self.cells[c]]
+        self.cells[c] = 0
+        self.moves -= 1
+        self.winner = None
+        self.ended = False
+
+    def reward(self, sym):
+        if not self.game_over():
+            return 0
+        return 1 if self.winner == sym else 0
+
+    def get_state(self):
+        return self.hash
+
+    def game_over(self, force_recalculate=False):
+        # winner e ended já são mantidos por place e undo
+        return self.ended
+
+    def is_draw(self):
+        return self.ended and self.winner is None
+
+    def winner_of(self, state):
+        # Decodifica um estado qualquer e retorna (vencedor, terminou); usado só na primeira consulta de cada estado
+        cells = []
+        for c in range(self.rows*self.cols):
+            state, v = divmod(state, 3)
+            cells.append((0, self.x, self.o)[v])
+        for c, sym in enumerate(cells):
+            if sym != 0:
+                i, j = divmod(c, self.cols)
+                if any(self.line_length(cells, i, j, di, dj) >= self.k for di, dj in self.DIRECTIONS):
+                    return sym, True
+        return None, 0 not in cells
+
+    def draw_board(self):
+        for i in range(self.rows):
+            print("----" * self.cols + "-")
+            for j in range(self.cols):
+                print("  ", end="")
+                sym = self.cells[i*self.cols + j]
+                if sym == self.x:
+                    print("x ", end="")
+                elif sym == self.o:
+                    print("o ", end="")
+                else:
+                    print("  ", end="")
+            print("")
+        print("----" * self.cols + "-")
+
+
+# Tabela de valores esparsa para tabuleiros m,n,k, onde um array denso de 3^(rows*cols) entradas não cabe na memória
+# Só os estados visitados são guardados; na primeira consulta o valor inicial segue initialV_x/initialV_o:
+# 1 se sym venceu, 0 se perdeu ou empatou e 0.5 se o jogo não terminou.
+class LazyValueTable(dict):
+
+    def __init__(self, env, sym):
+        super().__init__()
+        self.env = env
+        self.sym = sym
+
+    def __missing__(self, state):
+        winner, ended = self.env.winner_of(state)
+        if ended:
+            v = 1 if winner == self.sym else 0
+        else:
+            v = 0.5
+        self[state] = v
+        return v
+
+
 # Classe Humano
 class Human:
     def __init__(self):
@@ -274,7 +633,7 @@ class Human:
             i = int(i)
             j = int(j)
             if env.is_empty(i, j):
-                env.board[i,j] = self.sym
+                env.place(i, j, self.sym)
                 break
 
     def update(self, env):
@@ -284,6 +643,148 @@ class Human:
         pass
 
 
+# Classe Solver: jogador perfeito (negamax com poda alfa-beta e tabela de transposição indexada pelo hash do estado)
+# A política ótima de todas as posições alcançáveis é pré-calculada, então cada movimento custa um acesso à tabela.
+# Valores do ponto de vista de quem joga: vitória = 1 + células vazias restantes, derrota = o negativo, empate = 0
+# (assim o solver prefere vencer mais cedo e perder mais tarde).
+class Solver:
+
+    # Tipos de entrada da tabela de transposição
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def __init__(self, terminal=None):
+        self.env = Environment()
+        self.winner, self.ended = terminal if terminal is not None else load_terminal_tables()
+
+        # Tabela de transposição: (estado, símbolo de quem joga) -> (valor, tipo)
+        self.tt = {}
+
+        # Política ótima: policy[sym][state] = célula k do melhor movimento (-1 se não calculada)
+        self.policy = {sym: np.full(self.env.num_states, -1, dtype=np.int8) for sym in (self.env.x, self.env.o)}
+        for first in (self.env.x, self.env.o):
+            self.build_policy(first)
+
+    def set_symbol(self, sym):
+        self.sym = sym
+
+    def other(self, sym):
+        return self.env.o if sym == self.env.x else self.env.x
+
+    def cells(self, state):
+        # Células vazias de um estado, decodificando seus dígitos base-3
+        return [k for k in range(LENGTH*LENGTH) if state // POW3[k] % 3 == 0]
+
+    def negamax(self, state, sym, alpha=-np.inf, beta=np.inf):
+        # Valor do estado para o jogador sym, que está na vez
+        alpha0 = alpha
+        entry = self.tt.get((state, sym))
+        if entry is not None:
+            value, flag = entry
+            if flag == self.EXACT:
+                return value
+            if flag == self.LOWER:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                return value
+
+        cells = self.cells(state)
+        if self.ended[state]:
+            w = self.winner[state]
+            if w == 0:
+                return 0
+            return 1 + len(cells) if w == sym else -(1 + len(cells))
+
+        code = self.env.code[sym]
+        best = -np.inf
+        for k in cells:
+            value = -self.negamax(state + POW3[k] * code, self.other(sym), -beta, -alpha)
+            best = max(best, value)
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if best <= alpha0:
+            flag = self.UPPER
+        elif best >= beta:
+            flag = self.LOWER
+        else:
+            flag = self.EXACT
+        self.tt[(state, sym)] = (best, flag)
+        return best
+
+    def best_move(self, state, sym):
+        # Célula do melhor movimento (o primeiro, na ordem das células, entre os de mesmo valor)
+        code = self.env.code[sym]
+        best, best_value = -1, -np.inf
+        for k in self.cells(state):
+            value = -self.negamax(state + POW3[k] * code, self.other(sym))
+            if value > best_value:
+                best, best_value = k, value
+        return best
+
+    def build_policy(self, first):
+        # Percorre todas as posições alcançáveis a partir do tabuleiro vazio quando first começa
+        stack = [(0, first)]
+        seen = set(stack)
+        while stack:
+            state, sym = stack.pop()
+            if self.ended[state]:
+                continue
+            self.policy[sym][state] = self.best_move(state, sym)
+            code = self.env.code[sym]
+            for k in self.cells(state):
+                child = (state + POW3[k] * code, self.other(sym))
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+
+    def take_action(self, env):
+        state = env.get_state()
+        k = self.policy[self.sym][state]
+        if k < 0:
+            # Posição fora da política pré-calculada (ex.: tabuleiro montado à mão)
+            k = self.best_move(state, self.sym)
+        env.place(k // LENGTH, k % LENGTH, self.sym)
+
+    def update(self, env):
+        pass
+
+    def update_state_history(self, s):
+        pass
+
+
+# Compara a política gananciosa de um agente com o jogo perfeito em todas as posições alcançáveis em que ele joga
+# (x sempre começa). Retorna a fração de posições em que o agente escolhe um movimento ótimo e a fração em que
+# ao menos preserva o resultado teórico (vitória, empate ou derrota) da posição.
+def score_policy(agent, solver):
+    env = solver.env
+    other = solver.other(agent.sym)
+    code = env.code[agent.sym]
+    optimal = preserved = total = 0
+    stack = [(0, env.x)]
+    seen = set(stack)
+    while stack:
+        state, sym = stack.pop()
+        if solver.ended[state]:
+            continue
+        cells = solver.cells(state)
+        if sym == agent.sym:
+            k = cells[agent.successor_values(state, np.array(cells), code).argmax()]
+            best = solver.negamax(state, sym)
+            value = -solver.negamax(state + POW3[k] * code, other)
+            optimal += value == best
+            preserved += np.sign(value) == np.sign(best)
+            total += 1
+        for k in cells:
+            child = (state + POW3[k] * env.code[sym], solver.other(sym))
+            if child not in seen:
+                seen.add(child)
+                stack.append(child)
+    return optimal / total, preserved / total
+
+
 # Função recursiva que retornará todos os estados possíveis (como ints) e quem é o vencedor correspondente para esses estados (se houver) 
 # (i, j) se refere à próxima célula no tabuleiro para permutar (precisamos tentar -1, 0, 1) 
 # jogos impossíveis são ignorados, ou seja, 3x e 3o em uma linha simultaneamente, pois isso nunca acontecerá em um jogo real
@@ -291,7 +792,8 @@ def get_state_hash_and_winner(env, i=0, j=0):
     results = []
 
     for v in (0, env.x, env.o):
-        env.board[i,j] = v
+        if v != 0:
+            env.place(i, j, v)
         if j == 2:
             if i == 2:
                 state = env.get_state()
@@ -302,9 +804,67 @@ def get_state_hash_and_winner(env, i=0, j=0):
                 results += get_state_hash_and_winner(env, i + 1, 0)
         else:
             results += get_state_hash_and_winner(env, i, j + 1)
+        if v != 0:
+            env.undo(i, j)
 
     return results
 
+# Grava o checkpoint em arquivos temporários e depois os renomeia, para nunca deixar um checkpoint pela metade
+def write_checkpoint(path, V, meta):
+    with open(path + '.npy.tmp', 'wb') as f:
+        np.save(f, V)
+    with open(path + '.json.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.npy.tmp', path + '.npy')
+    os.replace(path + '.json.tmp', path + '.json')
+
+# Lê um checkpoint, recusando versões ou tamanhos de tabuleiro diferentes dos atuais
+def read_checkpoint(path, mmap=False):
+    with open(path + '.json') as f:
+        meta = json.load(f)
+    if meta['version'] != CHECKPOINT_VERSION or meta['length'] != LENGTH:
+        raise ValueError("Checkpoint incompatível: %s (versão %s, LENGTH %s)" % (path, meta['version'], meta['length']))
+    V = np.load(path + '.npy', mmap_mode='c' if mmap else None)
+    return V, meta
+
+# Converte a enumeração de get_state_hash_and_winner em arrays indexados pelo hash do estado:
+# winner[state] = símbolo do vencedor (0 se não houver) e ended[state] = True se o jogo terminou
+def build_terminal_tables(env, state_winner_triples):
+    winner = np.zeros(env.num_states, dtype=np.int8)
+    ended = np.zeros(env.num_states, dtype=bool)
+    for state, w, e in state_winner_triples:
+        winner[state] = 0 if w is None else w
+        ended[state] = e
+    return winner, ended
+
+# Carrega as tabelas de estados terminais do cache em disco, construindo-as e salvando-as na primeira execução
+_terminal_tables = None
+
+def load_terminal_tables(path=TERMINAL_CACHE):
+    global _terminal_tables
+    if _terminal_tables is None:
+        if os.path.exists(path):
+            with np.load(path) as data:
+                _terminal_tables = (data['winner'], data['ended'])
+        else:
+            env = Environment()
+            _terminal_tables = build_terminal_tables(env, get_state_hash_and_winner(env))
+            # Grava em um arquivo temporário e renomeia, para que ninguém leia o cache pela metade
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmp, 'wb') as f:
+                np.savez(f, winner=_terminal_tables[0], ended=_terminal_tables[1])
+            os.replace(tmp, path)
+    return _terminal_tables
+
+# Responde game_over a partir das tabelas terminais: um único acesso indexado pelo hash incremental
+def lookup_terminal(env):
+    winner, ended = env.terminal
+    state = env.get_state()
+    env.ended = bool(ended[state])
+    w = winner[state]
+    env.winner = None if w == 0 else int(w)
+    return env.ended
+
 # Inicializa os estados de x com a função valor
 def initialV_x(env, state_winner_triples):
     # if x wins, V(s) = 1
@@ -370,37 +930,450 @@ def play_game(p1, p2, env, draw=False):
     p2.update(env)
 
 
-if __name__ == '__main__':
-    # Treina o agente
+# Treinamento em lote: n partidas de p1 contra p2 avançam juntas, um movimento por vez, em arrays NumPy (n x 9).
+# Versão vetorizada de play_game, que continua sendo a implementação de referência:
+# - a escolha epsilon-gananciosa é um argmax sobre V[estados candidatos] de todas as partidas ao mesmo tempo;
+# - o fim de jogo é consultado nas tabelas terminais pelo hash de cada partida;
+# - a atualização V(s) = V(s) + alpha*(alvo - V(s)) percorre os históricos de trás para frente, uma jogada por vez.
+# Quando várias partidas do lote atualizam o mesmo estado na mesma jogada, prevalece a última escrita.
+# A política só muda entre lotes, por isso lotes pequenos (n ~ 100) mantêm a convergência de play_game.
+def train_batch(p1, p2, T, n=100, terminal=None):
+    winner, ended = terminal if terminal is not None else load_terminal_tables()
+    pow3 = np.array(POW3, dtype=np.int64)
+    cells = LENGTH*LENGTH
+    env = Environment()
+
+    for start in range(0, T, n):
+        N = min(n, T - start)
+        boards = np.zeros((N, cells), dtype=np.int8)
+        states = np.zeros(N, dtype=np.int64)
+        history = np.zeros((N, cells), dtype=np.int64)
+        lengths = np.zeros(N, dtype=np.int64)
+        active = np.ones(N, dtype=bool)
+
+        # Joga todas as partidas do lote em sincronia; p1 sempre começa
+        for t in range(cells):
+            rows = np.flatnonzero(active)
+            if len(rows) == 0:
+                break
+            player = p1 if t % 2 == 0 else p2
+            code = env.code[player.sym]
+            empty = boards[rows] == 0
+
+            # Valor de cada movimento possível (células ocupadas nunca são escolhidas)
+            candidates = np.where(empty, states[rows, None] + pow3 * code, 0)
+            values = np.where(empty, player.V[player.key(candidates)], -np.inf)
+            greedy = values.argmax(axis=1)
+
+            # Movimento aleatório: célula vazia com o maior ruído uniforme
+            noise = np.where(empty, np.random.rand(len(rows), cells), -1)
+            explore = np.random.rand(len(rows)) < player.eps
+            move = np.where(explore, noise.argmax(axis=1), greedy)
+
+            boards[rows, move] = code
+            states[rows] += pow3[move] * code
+            history[rows, t] = states[rows]
+            lengths[rows] += 1
+            active[rows] = ~ended[states[rows]]
+
+        # Atualiza a função valor de cada jogador sobre os históricos do lote
+        for player in (p1, p2):
+            target = (winner[states] == player.sym).astype(float)
+            for t in reversed(range(cells)):
+                rows = lengths > t
+                prev = player.key(history[rows, t])
+                value = player.V[prev] + player.alpha*(target[rows] - player.V[prev])
+                player.V[prev] = value
+                target[rows] = value
+
+
+# Processo de trabalho do treinamento paralelo: joga T partidas com V em memória compartilhada.
+# As atualizações são feitas sem lock (estilo Hogwild): cada processo escreve diretamente nas tabelas compartilhadas.
+def _self_play_worker(args):
+    names, syms, eps, alpha, canonical, T, seed, terminal = args
+    np.random.seed(seed)
+    shms = [shared_memory.SharedMemory(name=name) for name in names]
+    try:
+        players = []
+        for shm, sym in zip(shms, syms):
+            player = Agent(eps, alpha, canonical)
+            player.setV(np.ndarray(3**(LENGTH*LENGTH), dtype=np.float64, buffer=shm.buf))
+            player.set_symbol(sym)
+            players.append(player)
+        p1, p2 = players
+        for t in range(T):
+            play_game(p1, p2, Environment(terminal))
+        # Libera as visões dos buffers antes de fechar a memória compartilhada
+        del p1, p2, players, player
+    finally:
+        for shm in shms:
+            shm.close()
+    return T
+
+
+# Treinamento paralelo: T partidas divididas entre processos que compartilham V1 e V2 via shared_memory.
+# Ao final, as tabelas compartilhadas são copiadas de volta para p1.V e p2.V.
+# As tabelas terminais são carregadas uma vez aqui e enviadas aos processos junto com as partidas.
+def train_parallel(p1, p2, T, workers=None, seed=0):
+    workers = workers or os.cpu_count()
+    terminal = load_terminal_tables()
+    shms = []
+    try:
+        for player in (p1, p2):
+            shm = shared_memory.SharedMemory(create=True, size=player.V.nbytes)
+            np.ndarray(player.V.shape, dtype=np.float64, buffer=shm.buf)[:] = player.V
+            shms.append(shm)
+
+        # Cada processo recebe sua parte das partidas e uma semente própria
+        names = [shm.name for shm in shms]
+        canonical = p1.canonical is not None
+        jobs = [(names, (p1.sym, p2.sym), p1.eps, p1.alpha, canonical, T // workers + (w < T % workers), seed + w,
+                 terminal) for w in range(workers)]
+        with multiprocessing.Pool(workers) as pool:
+            pool.map(_self_play_worker, jobs)
+
+        for player, shm in zip((p1, p2), shms):
+            player.V[:] = np.ndarray(player.V.shape, dtype=np.float64, buffer=shm.buf)
+    finally:
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+
+# Cria o par de agentes de treinamento (p1 joga com x, p2 com o) com V inicial
+def init_agents(env, state_winner_triples, **kwargs):
+    p1 = Agent(**kwargs)
+    p2 = Agent(**kwargs)
+    p1.setV(initialV_x(env, state_winner_triples))
+    p2.setV(initialV_o(env, state_winner_triples))
+    p1.set_symbol(env.x)
+    p2.set_symbol(env.o)
+    return p1, p2
+
+
+# Joga n partidas do agente (sem explorar e sem aprender) contra um oponente aleatório; x sempre começa
+# Retorna as frações de vitórias, empates e derrotas do agente
+def evaluate(agent, n=1000, terminal=None):
+    env = Environment()
+    opponent = Agent(eps=1.0, alpha=0)
+    opponent.setV(np.zeros(env.num_states))
+    opponent.set_symbol(env.o if agent.sym == env.x else env.x)
+
+    eps, alpha = agent.eps, agent.alpha
+    agent.eps, agent.alpha = 0, 0
+    results = {agent.sym: 0, opponent.sym: 0, None: 0}
+    for t in range(n):
+        env = Environment(terminal)
+        if agent.sym == env.x:
+            play_game(agent, opponent, env)
+        else:
+            play_game(opponent, agent, env)
+        results[env.winner] += 1
+    agent.eps, agent.alpha = eps, alpha
+    return results[agent.sym] / n, results[None] / n, results[opponent.sym] / n
+
+
+# Convergência do V denso vs V canônico (simetrias compartilhadas), com a média sobre as sementes: taxa de derrotas
+# de p1 (x) e p2 (o) contra um oponente aleatório em cada checkpoint, a diferença canônico - denso com 2 erros-padrão
+# (pareada por semente) e a partir de quantos episódios a taxa de derrotas de o fica em threshold ou menos em todos os
+# checkpoints seguintes. x logo deixa de perder para o oponente aleatório, então são as derrotas de o que distinguem os dois modos
+def benchmark_canonical(checkpoints=(100, 200, 500, 1000, 2000, 5000, 10000), seeds=tuple(range(8)), threshold=0.2):
+    env = Environment()
+    state_winner_triples = get_state_hash_and_winner(env)
+    terminal = load_terminal_tables()
+    get_canonical_table()
+    losses = []
+    for canonical in (False, True):
+        rows = []
+        elapsed = 0
+        for seed in seeds:
+            np.random.seed(seed)
+            p1, p2 = init_agents(env, state_winner_triples, canonical=canonical)
+            row = []
+            for t in range(1, checkpoints[-1] + 1):
+                start = time.perf_counter()
+                play_game(p1, p2, Environment(terminal))
+                elapsed += time.perf_counter() - start
+                if t in checkpoints:
+                    row.append((evaluate(p1, terminal=terminal)[2], evaluate(p2, terminal=terminal)[2]))
+            rows.append(row)
+        # sementes x checkpoints x (x, o)
+        losses.append(np.array(rows))
+        print("%-10s %9.1f episódios/s" % ("V canônico" if canonical else "V denso",
+                                           checkpoints[-1] * len(seeds) / elapsed))
+
+    dense, canonical = losses
+    gap = canonical - dense
+    mean_gap = gap.mean(axis=0)
+    error = 2 * gap.std(axis=0, ddof=1) / np.sqrt(len(seeds))
+    print("derrotas (média de %d sementes): denso, canônico e canônico - denso ± 2 erros-padrão" % len(seeds))
+    for j, t in enumerate(checkpoints):
+        print("  %6d episódios  x: %.3f %.3f %+.3f ± %.3f   o: %.3f %.3f %+.3f ± %.3f"
+              % (t, dense[:, j, 0].mean(), canonical[:, j, 0].mean(), mean_gap[j, 0], error[j, 0],
+                 dense[:, j, 1].mean(), canonical[:, j, 1].mean(), mean_gap[j, 1], error[j, 1]))
+    for name, table in (("V denso", dense), ("V canônico", canonical)):
+        # Primeiro checkpoint depois da última vez em que as derrotas de o passaram de threshold
+        reached = [checkpoints[len(row) - np.argmax(row[::-1])] if row.any() else checkpoints[0]
+                   for row in table[:, :, 1] > threshold if not row[-1]]
+        print("%-10s derrotas de o <= %.2f a partir de uma mediana de %s episódios (%d/%d sementes)"
+              % (name, threshold, int(np.median(reached)) if reached else "-", len(reached), len(seeds)))
+
+
+# Paridade entre play_game (referência) e train_batch: os dois treinamentos partem do mesmo V inicial
+# e devem chegar às mesmas taxas de vitória/empate/derrota contra um oponente aleatório (média sobre as sementes).
+# Como a política de train_batch só muda entre lotes, as taxas não são idênticas: o teste passa se nenhuma
+# diferença passar de tolerance mais 2 erros-padrão da diferença (estimados pela variação entre as sementes).
+# Retorna True/False; com -bench batch o processo termina com código 1 se falhar
+def check_batch_parity(T=10000, seeds=tuple(range(8)), tolerance=0.05):
+    env = Environment()
+    state_winner_triples = get_state_hash_and_winner(env)
+    terminal = load_terminal_tables()
+    results = []
+    for batch in (False, True):
+        rates = []
+        elapsed = 0
+        for seed in seeds:
+            np.random.seed(seed)
+            p1, p2 = init_agents(env, state_winner_triples)
+            start = time.perf_counter()
+            if batch:
+                train_batch(p1, p2, T, terminal=terminal)
+            else:
+                for t in range(T):
+                    play_game(p1, p2, Environment(terminal))
+            elapsed += time.perf_counter() - start
+            rates.append(evaluate(p1, terminal=terminal) + evaluate(p2, terminal=terminal))
+        results.append(np.array(rates))
+        x_win, x_draw, x_loss, o_win, o_draw, o_loss = np.mean(rates, axis=0)
+        print("%-11s %9.1f episódios/s  x: vitórias %.3f empates %.3f  o: vitórias %.3f empates %.3f"
+              % ("train_batch" if batch else "play_game", T * len(seeds) / elapsed, x_win, x_draw, o_win, o_draw))
+
+    reference, batch = results
+    diff = np.abs(reference.mean(axis=0) - batch.mean(axis=0))
+    stderr = np.sqrt((reference.var(axis=0, ddof=1) + batch.var(axis=0, ddof=1)) / len(seeds))
+    limit = tolerance + 2*stderr
+    ok = bool(np.all(diff <= limit))
+    worst = np.argmax(diff / limit)
+    print("paridade %s: maior diferença %.3f (limite %.3f = tolerância %.3f + 2 erros-padrão)"
+          % ("OK" if ok else "FALHOU", diff[worst], limit[worst], tolerance))
+    return ok
+
+
+# Escalabilidade do treinamento paralelo: episódios/segundo com 1 a N processos
+def benchmark_parallel(T=40000, max_workers=None):
+    env = Environment()
+    state_winner_triples = get_state_hash_and_winner(env)
+    load_terminal_tables()
+    base = None
+    for workers in range(1, (max_workers or os.cpu_count()) + 1):
+        p1, p2 = init_agents(env, state_winner_triples)
+        start = time.perf_counter()
+        train_parallel(p1, p2, T, workers)
+        rate = T / (time.perf_counter() - start)
+        base = base or rate
+        print("%2d processos %9.1f episódios/s  (%.2fx)" % (workers, rate, rate / base))
+
+
+# Mede a distância até o jogo perfeito de agentes treinados com T episódios: fração de movimentos ótimos e
+# de movimentos que preservam o resultado, e o resultado de partidas contra o solver
+def benchmark_solver(checkpoints=(1000, 10000, 50000), seed=0):
+    env = Environment()
+    state_winner_triples = get_state_hash_and_winner(env)
+    terminal = load_terminal_tables()
+
+    start = time.perf_counter()
+    solver = Solver(terminal)
+    print("Solver: política de %d posições em %.1f s" % (sum((p >= 0).sum() for p in solver.policy.values()),
+                                                        time.perf_counter() - start))
+
+    np.random.seed(seed)
+    p1, p2 = init_agents(env, state_winner_triples)
+    for t in range(1, checkpoints[-1] + 1):
+        play_game(p1, p2, Environment(terminal))
+        if t in checkpoints:
+            print("%6d episódios" % t)
+            for agent in (p1, p2):
+                optimal, preserved = score_policy(agent, solver)
+                solver.set_symbol(solver.other(agent.sym))
+                eps, alpha = agent.eps, agent.alpha
+                agent.eps, agent.alpha = 0, 0
+                game = Environment(terminal)
+                if agent.sym == env.x:
+                    play_game(agent, solver, game)
+                else:
+                    play_game(solver, agent, game)
+                agent.eps, agent.alpha = eps, alpha
+                result = "empate" if game.winner is None else "vitória" if game.winner == agent.sym else "derrota"
+                print("  %s: movimentos ótimos %.3f  resultado preservado %.3f  contra o solver: %s"
+                      % ("x" if agent.sym == env.x else "o", optimal, preserved, result))
+
+
+# Memória e episódios/segundo em tabuleiros m,n,k com V esparso (LazyValueTable), comparados ao tamanho que
+# um V denso teria (3^(rows*cols) entradas de 8 bytes)
+def benchmark_mnk(configs=((3, 3, 3), (4, 4, 4), (5, 5, 4)), T=2000, seed=0):
+    for rows, cols, k in configs:
+        np.random.seed(seed)
+        env = MNKEnvironment(rows, cols, k)
+        p1 = Agent()
+        p2 = Agent()
+        p1.set_symbol(env.x)
+        p2.set_symbol(env.o)
+
+        p1.setV(LazyValueTable(env, env.x))
+        p2.setV(LazyValueTable(env, env.o))
+        start = time.perf_counter()
+        for t in range(T):
+            play_game(p1, p2, MNKEnvironment(rows, cols, k))
+        elapsed = time.perf_counter() - start
+
+        # Memória das duas tabelas: o dicionário mais as chaves (estados) e os valores
+        memory = sum(sys.getsizeof(V) + sum(sys.getsizeof(s) + sys.getsizeof(v) for s, v in V.items())
+                     for V in (p1.V, p2.V))
+
+        print("%dx%d k=%d  %8.1f episódios/s  %7d estados  %8.2f MB (V denso: %.3g MB)"
+              % (rows, cols, k, T / elapsed, len(p1.V) + len(p2.V), memory / 2**20, 2 * 8 * env.num_states / 2**20))
+
+
+# Treina e joga em um tabuleiro m,n,k (python 01-agente-tic-tac-toe.py -mnk 4 4 3)
+def play_mnk(rows, cols, k, T=10000):
+    env = MNKEnvironment(rows, cols, k)
     p1 = Agent()
     p2 = Agent()
+    p1.set_symbol(env.x)
+    p2.set_symbol(env.o)
+    p1.setV(LazyValueTable(env, env.x))
+    p2.setV(LazyValueTable(env, env.o))
+    for t in range(T):
+        if t % 200 == 0:
+            print(t)
+        play_game(p1, p2, MNKEnvironment(rows, cols, k))
+
+    # Jogando: Humano x Agente
+    human = Human()
+    human.set_symbol(env.o)
+    while True:
+        p1.set_verbose(True)
+        play_game(p1, human, MNKEnvironment(rows, cols, k), draw=2)
+        answer = input("Jogar novamente? [Y/n]: ")
+        if answer and answer.lower()[0] == 'n':
+            break
+
 
-    # Configura initial V para p1 e p2
+# Compara episódios/segundo de treinamento entre o tabuleiro NumPy e o bitboard, com e sem a tabela de estados terminais
+# Todas as execuções usam a mesma semente, logo jogam exatamente as mesmas partidas
+def benchmark_backends(T=2000, seed=0):
     env = Environment()
     state_winner_triples = get_state_hash_and_winner(env)
+    terminal = load_terminal_tables()
+    for env_class, table in ((Environment, None), (BitboardEnvironment, None),
+                             (Environment, terminal), (BitboardEnvironment, terminal)):
+        np.random.seed(seed)
+        p1, p2 = init_agents(env, state_winner_triples)
+
+        start = time.perf_counter()
+        for t in range(T):
+            play_game(p1, p2, env_class(table))
+        elapsed = time.perf_counter() - start
+        name = env_class.__name__ + (" + tabela" if table is not None else "")
+        print("%-28s %8.1f episódios/s" % (name, T / elapsed))
+
+
+if __name__ == '__main__':
+    # Benchmarks: python 01-agente-tic-tac-toe.py -bench board|canonical|batch|parallel|solver|mnk
+    if '-bench' in sys.argv:
+        bench = sys.argv[sys.argv.index('-bench') + 1]
+        if bench == 'board':
+            benchmark_backends()
+        elif bench == 'canonical':
+            benchmark_canonical()
+        elif bench == 'batch':
+            if not check_batch_parity():
+                sys.exit(1)
+        elif bench == 'parallel':
+            benchmark_parallel()
+        elif bench == 'solver':
+            benchmark_solver()
+        elif bench == 'mnk':
+            benchmark_mnk()
+        sys.exit()
+
+    # Tabuleiro m,n,k: python 01-agente-tic-tac-toe.py -mnk ROWS COLS K
+    if '-mnk' in sys.argv:
+        idx = sys.argv.index('-mnk')
+        play_mnk(*(int(v) for v in sys.argv[idx + 1:idx + 4]))
+        sys.exit()
+
+    # Tabuleiro usado no treinamento: NumPy (padrão) ou bitboard (-bitboard)
+    EnvClass = BitboardEnvironment if '-bitboard' in sys.argv else Environment
+
+    # Checkpoints de V: -checkpoint DIR salva periodicamente (e retoma) o treinamento em DIR/vx e DIR/vo
+    checkpoint = sys.argv[sys.argv.index('-checkpoint') + 1] if '-checkpoint' in sys.argv else None
+
+    # Treina o agente (-canonical: as simetrias de uma posição compartilham o mesmo valor)
+    canonical = '-canonical' in sys.argv
+    p1 = Agent(canonical=canonical)
+    p2 = Agent(canonical=canonical)
 
+    env = Environment()
 
-    Vx = initialV_x(env, state_winner_triples)
-    p1.setV(Vx)
-    Vo = initialV_o(env, state_winner_triples)
-    p2.setV(Vo)
+    # Tabelas de estados terminais: game_over passa a ser um acesso indexado pelo hash
+    terminal = load_terminal_tables()
 
     # Define o símbolo de cada jogador
     p1.set_symbol(env.x)
     p2.set_symbol(env.o)
 
     T = 10000
-    for t in range(T):
-        if t % 200 == 0:
-            print(t)
-        play_game(p1, p2, Environment())
+    if checkpoint and '-play' in sys.argv:
+        # Joga imediatamente: V de x é mapeado do checkpoint, sem treinamento
+        done = p1.load(os.path.join(checkpoint, 'vx'), mmap=True)
+        T = done
+    elif checkpoint and os.path.exists(os.path.join(checkpoint, 'vx.json')):
+        # Retoma o treinamento a partir do último checkpoint
+        done = p1.load(os.path.join(checkpoint, 'vx'))
+        p2.load(os.path.join(checkpoint, 'vo'))
+    else:
+        # Configura initial V para p1 e p2
+        state_winner_triples = get_state_hash_and_winner(env)
+        Vx = initialV_x(env, state_winner_triples)
+        p1.setV(Vx)
+        Vo = initialV_o(env, state_winner_triples)
+        p2.setV(Vo)
+        done = 0
+    if checkpoint:
+        os.makedirs(checkpoint, exist_ok=True)
+
+    # Treina em blocos; ao fim de cada bloco o checkpoint é gravado em segundo plano
+    every = 1000
+    saving = []
+    while done < T:
+        chunk = min(every, T - done)
+        if '-batch' in sys.argv:
+            # Treinamento vetorizado: todas as partidas de um lote avançam juntas
+            train_batch(p1, p2, chunk, terminal=terminal)
+        elif '-workers' in sys.argv:
+            # Treinamento em vários processos com V em memória compartilhada
+            train_parallel(p1, p2, chunk, int(sys.argv[sys.argv.index('-workers') + 1]), seed=done)
+        else:
+            for t in range(done, done + chunk):
+                if t % 200 == 0:
+                    print(t)
+                play_game(p1, p2, EnvClass(terminal))
+        done += chunk
+        if checkpoint:
+            for thread in saving:
+                thread.join()
+            saving = [p1.save(os.path.join(checkpoint, 'vx'), done, background=True),
+                      p2.save(os.path.join(checkpoint, 'vo'), done, background=True)]
+    for thread in saving:
+        thread.join()
 
     # Jogando: Humano x Agente
     human = Human()
     human.set_symbol(env.o)
     while True:
         p1.set_verbose(True)
-        play_game(p1, human, Environment(), draw=2)
+        play_game(p1, human, EnvClass(terminal), draw=2)
         answer = input("Jogar novamente? [Y/n]: ")
         if answer and answer.lower()[0] == 'n':
             break
\ No newline at end of file
@@ -3,6 +3,7 @@
 
 # Módulo de conhecimento do agente
 
+import heapq
 import random
 
 from enumeration import Status, Entity, Action, Goal
@@ -24,7 +25,7 @@ def perceive(kb, loc):
   wumpus, pit, gold = (Status.Absent,) * 3
   
   # Olhar células vizinhas para atualizar as percepções
-  for room in [kb[l] for l in neighbors(loc)]:
+  for room in [kb[l] for l in neighbors(loc, kb.size)]:
     
     # Verifique se o wumpus está nesta sala
     if room.wumpus == Status.Present:
@@ -54,7 +55,7 @@ def tell(kb, perceptions, loc):
   
   kb[loc].wumpus = kb[loc].pit = Status.Absent
   wumpus, pit, gold = perceptions
-  near = [kb[l] for l in neighbors(loc)]
+  near = [kb[l] for l in neighbors(loc, kb.size)]
   
   # Iterar sobre salas vizinhas não seguras
   for room in (r for r in near if not r.is_safe()):
@@ -69,9 +70,9 @@ def tell(kb, perceptions, loc):
         if len([r for r in near if r.is_dangerous(Entity.Wumpus)]) == 1:
           room.wumpus = Status.Present
       elif room.wumpus == Status.Unknown:
-        if any(r.is_deadly(Entity.Wumpus) for r in near):
+        if kb.wumpuses == 1 and any(r.is_deadly(Entity.Wumpus) for r in near):
     
-          # O agente sabe o local Wumpus -> ele não pode estar nesta sala
+          # O agente sabe o local do único Wumpus -> ele não pode estar nesta sala
           room.wumpus = Status.Absent
         elif all(r.is_safe(Entity.Wumpus) for r in near if r != room):
     
@@ -101,7 +102,40 @@ def tell(kb, perceptions, loc):
   kb[loc].gold = gold
 
 
-def update(kb, loc):
+def update(kb, loc, fixpoint=False):
+
+  """Atualizar o conhecimento.
+   Tem o mesmo resultado de update_full, mas só reavalia as salas exploradas cuja
+   vizinhança mudou desde a sua última avaliação (as outras não mudariam nada).
+   As salas sujas são visitadas em uma varredura na ordem de update_full; as que
+   ficam sujas atrás da posição atual ficam para a próxima chamada, como em
+   update_full. Com fixpoint=True, as varreduras se repetem até nada mudar."""
+
+  while True:
+    heap = [(y, x) for x, y in kb.take_dirty()]
+    heapq.heapify(heap)
+    queued = set(heap)
+    deferred = set()
+    while heap:
+      y, x = position = heapq.heappop(heap)
+      if not kb[x, y].is_explored:
+        continue
+      tell(kb, perceive(kb, (x, y)), (x, y))
+
+      # Salas à frente são avaliadas nesta varredura; as demais, na próxima
+      for l in kb.take_dirty():
+        later = l[1], l[0]
+        if later <= position:
+          deferred.add(l)
+        elif later not in queued:
+          queued.add(later)
+          heapq.heappush(heap, later)
+    kb.mark_dirty(deferred)
+    if not fixpoint or not deferred:
+      return
+
+
+def update_full(kb, loc):
   
   """Atualizar o conhecimento."""
   # Atualiza o conhecimento de acordo com todas as células já exploradas
@@ -127,22 +161,22 @@ def ask(kb, loc, direction, goal):
     
     # Obtém o primeiro quarto vizinho seguro e inexplorado (se houver)
     state = lambda r: r.is_safe() and r.is_unexplored
-    dest = next((l for l in neighbors(loc) if state(kb[l])), None)
+    dest = next((l for l in neighbors(loc, kb.size) if state(kb[l])), None)
     if dest:
-      return Action.Move, (spins(loc, direction, dest),)
+      return Action.Move, (spins(loc, direction, dest, kb.size),)
     
     # Obtém qualquer espaço seguro e inexplorado (se o agente pode alcançá-lo)
-    state = lambda r, l: r.is_safe() and any(kb[x].is_explored for x in neighbors(l))
+    state = lambda r, l: r.is_safe() and any(kb[x].is_explored for x in neighbors(l, kb.size))
     dest = next((l for l in kb.unexplored if state(kb[l], l)), None)
     if dest:
-      path = known_path(kb, loc, dest)
-      return Action.Move, path_to_spins(path, direction)
+      path = known_path(kb, loc, dest, direction)
+      return Action.Move, path_to_spins(path, direction, kb.size)
     
     # Obtém uma sala vizinha que pode conter o Wumpus, mas sem poços
     state = lambda r: r.is_safe(Entity.Pit) and r.is_unsafe(Entity.Wumpus)
-    dest = next((l for l in neighbors(loc) if state(kb[l])), None)
+    dest = next((l for l in neighbors(loc, kb.size) if state(kb[l])), None)
     if dest:
-      return Action.Shoot, spins(loc, direction, dest)
+      return Action.Shoot, spins(loc, direction, dest, kb.size)
     
     # Obtém um quarto que podem conter o Wumpus mas não poços
     state = lambda r: r.is_safe(Entity.Pit) and r.is_unsafe(Entity.Wumpus)
@@ -150,33 +184,33 @@ def ask(kb, loc, direction, goal):
     if dest:
     
       # Obtém uma célula vizinha explorada 
-      dest = next((l for l in neighbors(dest) if kb[l].is_explored))
-      path = known_path(kb, loc, dest)
-      return Action.Move, path_to_spins(path, direction)
+      dest = next((l for l in neighbors(dest, kb.size) if kb[l].is_explored))
+      path = known_path(kb, loc, dest, direction)
+      return Action.Move, path_to_spins(path, direction, kb.size)
     
     # Obtém um quarto vizinho que pode conter o Wumpus
     state = lambda r: r.is_dangerous(Entity.Wumpus)
-    dest = next((l for l in neighbors(loc) if state(kb[l])), None)
+    dest = next((l for l in neighbors(loc, kb.size) if state(kb[l])), None)
     if dest:
-      return Action.Shoot, spins(loc, direction, dest)
+      return Action.Shoot, spins(loc, direction, dest, kb.size)
     
     # Obtém um quarto vizinho que pode conter um poço
     rooms = [l for l in kb.unexplored if kb[l].is_dangerous(Entity.Pit)]
     if rooms:
       dest = random.choice(rooms)
-      path = known_path(kb, loc, dest)
-      return Action.Move, path_to_spins(path, direction)
+      path = known_path(kb, loc, dest, direction)
+      return Action.Move, path_to_spins(path, direction, kb.size)
     
     # Obtém uma célula inexplorada
     dest = next((l for l in kb.unexplored), None)
     if dest:
-      path = known_path(kb, loc, dest)
-      return Action.Move, path_to_spins(path, direction)
+      path = known_path(kb, loc, dest, direction)
+      return Action.Move, path_to_spins(path, direction, kb.size)
   elif goal == Goal.BackToEntry:
     
     # Voltar para a entrada
-    path = known_path(kb, loc, (0, 0))
-    return Action.Move, path_to_spins(path, direction)
+    path = known_path(kb, loc, (0, 0), direction)
+    return Action.Move, path_to_spins(path, direction, kb.size)
   
   # Incapaz de encontrar uma ação
   return None
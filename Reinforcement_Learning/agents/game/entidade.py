@@ -6,7 +6,7 @@
 import random
 
 from enumeration import Status, Entity, Action, CardinalDirection
-from movimento import turn, move_forward
+from movimento import turn, move_forward, neighbors, DistanceField
 
 
 
@@ -14,6 +14,9 @@ class Room:
 
   """Representa um único quarto da caverna."""
 
+  # (conhecimento, localização) avisado quando o status do quarto muda (veja Knowledge.changed)
+  _watch = None
+
   def __init__(self, wumpus=Status.Absent, pit=Status.Absent, gold=Status.Absent):
     
     """Inicializa o status do quarto.
@@ -31,6 +34,19 @@ class Room:
     return str([self.wumpus.value, self.pit.value, self.gold.value])
 
 
+  def __setattr__(self, name, value):
+
+    """Define o atributo, avisando o observador apenas se o valor realmente mudar."""
+
+    watch = self._watch
+    if watch is not None and getattr(self, name, None) != value:
+      object.__setattr__(self, name, value)
+      kb, location = watch
+      kb.changed(location, name)
+    else:
+      object.__setattr__(self, name, value)
+
+
   def is_safe(self, danger=None):
     
     """Retorna True se a sala não contém nem o Wumpus nem um poço."""
@@ -130,7 +146,7 @@ class Agent:
 
     kind, rotations = action
     if kind == Action.Move:
-      self.move(rotations)
+      self.move(rotations, cave.size)
     elif kind == Action.Shoot:
       if rotations is not None:
         self.direction = turn(self.direction, rotations)
@@ -143,13 +159,13 @@ class Agent:
     return False
 
 
-  def move(self, rotations):
+  def move(self, rotations, size=(4, 4)):
    
     """Move o agente."""
    
     for steps in rotations:
       self.direction = turn(self.direction, steps)
-      self.location = move_forward(self.location, self.direction)
+      self.location = move_forward(self.location, self.direction, size)
 
 
   def shoot(self, cave, kb):
@@ -216,12 +232,17 @@ class Agent:
 class Knowledge:
  
   """Representa o conhecimento do agente sobre a caverna."""
+
+  # Salas cuja vizinhança (incluindo a própria sala) mudou desde a última avaliação
+  _dirty = None
   
-  def __init__(self, size=(4, 4)):
+  def __init__(self, size=(4, 4), wumpuses=1):
  
-    """Inicializa uma nova instância da classe Knowledge."""
+    """Inicializa uma nova instância da classe Knowledge.
+    wumpuses é o número de Wumpus vivos na caverna."""
  
     self.size = size
+    self.wumpuses = wumpuses
  
     # Inicialmente o agente não sabe nada
     w, h = self.size
@@ -231,6 +252,17 @@ class Knowledge:
     # A entrada da caverna é segura e sem ouro
     self._rooms[0][0] = Room()
 
+    # Campos de distância por destino, válidos enquanto as salas exploradas não mudarem
+    self.explored_version = 0
+    self._fields = {}
+    self._fields_version = 0
+
+    # Observa as mudanças de cada sala; no início, todas precisam ser avaliadas
+    self._dirty = set()
+    for x, y in self.rooms():
+      self._rooms[y][x]._watch = self, (x, y)
+      self._dirty.add((x, y))
+
 
   def __repr__(self):
  
@@ -263,6 +295,9 @@ class Knowledge:
 
     x, y = location
     self._rooms[y][x] = value
+    if self._dirty is not None:
+      value._watch = self, location
+      self.changed(location)
 
 
   def rooms(self, condition=None):
@@ -295,10 +330,54 @@ class Knowledge:
     return self.rooms(lambda r: not r.is_explored)
 
 
+  def changed(self, location, attribute=None):
+
+    """Marca como sujas a sala e suas vizinhas, cujas inferências dependem dela.
+    Mudanças no ouro (ou na sala inteira) podem mudar as salas exploradas."""
+
+    if attribute is None or attribute == 'gold':
+      self.explored_version += 1
+    self._dirty.add(location)
+    self._dirty.update(neighbors(location, self.size))
+
+
+  def take_dirty(self):
+
+    """Retorna e esvazia o conjunto de salas sujas."""
+
+    dirty, self._dirty = self._dirty, set()
+    return dirty
+
+
+  def mark_dirty(self, locations):
+
+    """Marca as salas como sujas, sem afetar as vizinhas."""
+
+    self._dirty.update(locations)
+
+
+  def distance_field(self, dest):
+
+    """Retorna o DistanceField até dest, reaproveitado entre chamadas
+    enquanto o conjunto de salas exploradas não mudar."""
+
+    if self._fields_version != self.explored_version:
+      self._fields = {}
+      self._fields_version = self.explored_version
+    field = self._fields.get(dest)
+    if field is None:
+      field = self._fields[dest] = DistanceField(self, dest)
+    return field
+
+
   def kill_wumpus(self):
 
-    """Altera o status de qualquer sala de tal forma que não pode ser o Wumpus."""
+    """Registra a morte de um Wumpus. Quando não resta nenhum, altera o status
+    de qualquer sala de tal forma que não pode ser o Wumpus."""
 
+    self.wumpuses -= 1
+    if self.wumpuses > 0:
+      return
     for path in self._rooms:
       for room in path:
         room.wumpus = Status.Absent
@@ -309,28 +388,35 @@ class Cave(Knowledge):
   
   """Representa a caverna onde o Wumpus vive."""
 
-  def __init__(self, size=(4, 4)):
+  def __init__(self, size=(4, 4), pit_prob=0.2, wumpuses=1):
   
-    """Inicializa uma nova instância da classe Cave."""
+    """Inicializa uma nova instância da classe Cave, com `wumpuses` Wumpus
+    e um poço em cada sala (exceto a entrada) com probabilidade pit_prob."""
   
     self.size = size
+    self.wumpuses = wumpuses
   
     # A caverna contém uma matriz de quartos
     w, h = self.size
     self._rooms = [[Room() for x in range(w)] for y in range(h)]
     unsafe = [(x, y) for x in range(w) for y in range(h) if (x, y) != (0, 0)]
+    assert wumpuses <= len(unsafe)
   
-    # Coloca o Wumpus na caverna
-    x, y = random.choice(unsafe)
-    self._rooms[y][x].wumpus = Status.Present
+    # Coloca os Wumpus na caverna, em salas diferentes
+    placed = 0
+    while placed < wumpuses:
+      x, y = random.choice(unsafe)
+      if self._rooms[y][x].wumpus != Status.Present:
+        self._rooms[y][x].wumpus = Status.Present
+        placed += 1
   
     # Coloca o ouro na caverna
     x, y = random.choice(unsafe)
     self._rooms[y][x].gold = Status.Present
   
-    # Coloca poços na caverna (com probabilidade 0,2)
+    # Coloca poços na caverna (com probabilidade pit_prob)
     for x, y in unsafe:
-      if random.random() <= 0.2:
+      if random.random() <= pit_prob:
         self._rooms[y][x].pit = Status.Present
 
   
\ No newline at end of file
@@ -4,11 +4,14 @@
 # Módulo Game
 
 import sys
+import csv
+import time
 import random
+import multiprocessing
 
 from enumeration import Goal, Status, Action
 from entidade import Room, Agent, Knowledge, Cave
-from conhecimento import perceive, tell, update, ask
+from conhecimento import perceive, tell, update, update_full, ask
 
 
 
@@ -55,12 +58,13 @@ def parse_action(action):
     return Action.Shoot, None
 
 
-def print_cave(loc):
-  print(' __________________')
+def print_cave(loc, size=(4, 4)):
+  width, height = size
+  print(' ' + '_' * (5 * width - 2))
   y = 0
-  while y < 4:
+  while y < height:
     x = 0
-    while x < 4:
+    while x < width:
       print('|_X_|' if (x, y) == loc else '|___|', end='')
       x += 1
     print()
@@ -68,17 +72,225 @@ def print_cave(loc):
   print()
 
 
+# Fases de um turno do agente, na ordem em que são executadas
+PHASES = ('perceive', 'tell', 'update', 'ask', 'perform')
+
+# Campos de cada registro de jogo (veja play_headless)
+FIELDS = ('seed', 'outcome', 'steps', 'arrows', 'gold') + PHASES
+
+
+def play_headless(seed, max_steps=1000, update=update, trace=None,
+                  size=(4, 4), pit_prob=0.2, wumpuses=1):
+
+  """Joga uma caverna com o módulo de Inteligência Artificial, sem entrada nem saída.
+  O jogo usa random.seed(seed) e termina em vitória ('win'), morte ('death'),
+  agente sem ação possível ('stuck') ou após max_steps ações ('timeout').
+  Retorna um dicionário com os campos FIELDS; as fases têm o tempo total em segundos
+  e arrows é o número de ações Shoot executadas (o agente pode atirar mais de uma vez).
+  Se trace for uma lista, recebe o conhecimento (repr) após cada atualização.
+  size, pit_prob e wumpuses configuram a caverna (veja Cave)."""
+
+  random.seed(seed)
+  cave = Cave(size, pit_prob, wumpuses)
+  kb = Knowledge(size, wumpuses)
+  agent = Agent()
+  clock = time.perf_counter
+  timings = dict.fromkeys(PHASES, 0.0)
+  outcome = 'timeout'
+  steps = 0
+  arrows = 0
+  while steps < max_steps:
+    start = clock()
+    perceptions = perceive(cave, agent.location)
+    perceived = clock()
+    timings['perceive'] += perceived - start
+    if perceptions is None:
+      outcome = 'death'
+      break
+
+    tell(kb, perceptions, agent.location)
+    told = clock()
+    update(kb, agent.location)
+    updated = clock()
+    if trace is not None:
+      trace.append(repr(kb))
+    goal = Goal.SeekGold if not agent.has_gold else Goal.BackToEntry
+    action = ask(kb, agent.location, agent.direction, goal)
+    asked = clock()
+    timings['tell'] += told - perceived
+    timings['update'] += updated - told
+    timings['ask'] += asked - updated
+    if action is None:
+      outcome = 'stuck'
+      break
+
+    agent.perform(action, cave, kb)
+    timings['perform'] += clock() - asked
+    steps += 1
+    if action[0] == Action.Shoot:
+      arrows += 1
+    if agent.has_gold and agent.location == (0, 0):
+      outcome = 'win'
+      break
+
+  record = {'seed': seed, 'outcome': outcome, 'steps': steps,
+            'arrows': arrows, 'gold': agent.has_gold}
+  record.update(timings)
+  return record
+
+
+def run_headless(n, seed=0, max_steps=1000, workers=None, **options):
+
+  """Joga n cavernas sem interface; o jogo i usa a semente seed + i.
+  options (size, pit_prob, wumpuses) são repassadas a play_headless."""
+
+  return list(iter_headless(n, seed, max_steps, workers, **options))
+
+
+def iter_headless(n, seed=0, max_steps=1000, workers=None, shard=None, **options):
+
+  """Gera os registros dos n jogos, em ordem de semente, à medida que terminam.
+  Com workers, as sementes são divididas em blocos de `shard` jogos distribuídos
+  entre processos. Cada jogo só depende da sua semente e os blocos voltam em ordem
+  (imap), então os registros são os mesmos para qualquer número de processos."""
+
+  if workers is None:
+    for i in range(n):
+      yield play_headless(seed + i, max_steps, **options)
+    return
+  shard = shard or max(1, min(1000, n // (workers * 8)))
+  shards = [(seed + start, seed + min(start + shard, n), max_steps, options)
+            for start in range(0, n, shard)]
+  with multiprocessing.Pool(workers) as pool:
+    for records in pool.imap(_play_shard, shards):
+      for record in records:
+        yield record
+
+
+def _play_shard(shard):
+  first, last, max_steps, options = shard
+  return [play_headless(seed, max_steps, **options) for seed in range(first, last)]
+
+
+def benchmark_workers(n, seed=0, max_steps=1000, max_workers=None, **options):
+
+  """Joga as mesmas n cavernas com 1 a max_workers processos, mostrando o tempo,
+  o speedup e se os resultados (sem os tempos das fases) são idênticos aos de 1 processo."""
+
+  max_workers = max_workers or multiprocessing.cpu_count()
+  reference = None
+  for workers in range(1, max_workers + 1):
+    start = time.perf_counter()
+    records = run_headless(n, seed, max_steps, workers, **options)
+    seconds = time.perf_counter() - start
+    results = [tuple(r[f] for f in FIELDS if f not in PHASES) for r in records]
+    if reference is None:
+      reference, base = results, seconds
+    print('{:3} processos {:8.2f} s  speedup {:5.2f}  {}'.format(
+      workers, seconds, base / seconds, 'idênticos' if results == reference else 'DIFERENTES'))
+
+
+def check_update(n, seed=0, max_steps=1000, **options):
+
+  """Teste diferencial: joga n cavernas com update (incremental) e com update_full
+  e verifica que o conhecimento é o mesmo após cada turno. Retorna as sementes que divergiram."""
+
+  failures = []
+  for game in range(seed, seed + n):
+    incremental, full = [], []
+    play_headless(game, max_steps, update, incremental, **options)
+    play_headless(game, max_steps, update_full, full, **options)
+    if incremental != full:
+      failures.append(game)
+  print('{} cavernas, {} divergências {}'.format(n, len(failures), failures[:10]))
+  return failures
+
+
+def benchmark_sizes(n, seed=0, max_steps=1000, max_side=64, **options):
+
+  """Mostra como a latência de um turno cresce com a área da caverna: joga n
+  cavernas quadradas de lado 4, 8, 16... até max_side, com as mesmas options."""
+
+  options.pop('size', None)
+  side = 4
+  while side <= max_side:
+    records = run_headless(n, seed, max_steps, size=(side, side), **options)
+    steps = sum(r['steps'] for r in records) or 1
+    phases = {phase: 1e6 * sum(r[phase] for r in records) / steps for phase in PHASES}
+    print('{:4}x{:<4} área {:6}  {:10.1f} us/turno  (update {:.1f}, ask {:.1f})  {:.1f} passos/jogo'.format(
+      side, side, side * side, sum(phases.values()), phases['update'], phases['ask'], steps / n))
+    side *= 2
+
+
+def print_stats(records):
+
+  """Mostra taxas de vitória e morte, passos, flechas e o tempo médio de cada fase."""
+
+  n = len(records)
+  outcomes = [r['outcome'] for r in records]
+  print('Jogos: {}'.format(n))
+  for outcome in ('win', 'death', 'stuck', 'timeout'):
+    print('{:8} {:6.2f}%'.format(outcome, 100 * outcomes.count(outcome) / n))
+  print('Passos por jogo: {:.2f}'.format(sum(r['steps'] for r in records) / n))
+  print('Flechas usadas: {:.2f}'.format(sum(r['arrows'] for r in records) / n))
+  steps = sum(r['steps'] for r in records) or 1
+  for phase in PHASES:
+    print('{:8} {:10.2f} us/passo'.format(phase, 1e6 * sum(r[phase] for r in records) / steps))
+
+
+def write_csv(records, path):
+
+  """Grava os registros dos jogos em um arquivo CSV, um jogo por linha."""
+
+  with open(path, 'w', newline='') as f:
+    writer = csv.DictWriter(f, fieldnames=FIELDS)
+    writer.writeheader()
+    writer.writerows(records)
+
+
 
 if __name__ == '__main__':
 
   # Init seed
+  seed = None
   if '-seed' in sys.argv:
     seed = int(sys.argv[sys.argv.index('-seed') + 1])
     random.seed(seed)
+
+  # Configuração da caverna
+  options = {}
+  if '-size' in sys.argv:
+    i = sys.argv.index('-size')
+    options['size'] = int(sys.argv[i + 1]), int(sys.argv[i + 2])
+  if '-pits' in sys.argv:
+    options['pit_prob'] = float(sys.argv[sys.argv.index('-pits') + 1])
+  if '-wumpuses' in sys.argv:
+    options['wumpuses'] = int(sys.argv[sys.argv.index('-wumpuses') + 1])
+
+  # Joga N cavernas sem interface (o jogo i usa a semente seed + i) e mostra as estatísticas
+  if '-headless' in sys.argv:
+    n = int(sys.argv[sys.argv.index('-headless') + 1])
+    max_steps = int(sys.argv[sys.argv.index('-steps') + 1]) if '-steps' in sys.argv else 1000
+    if '-check' in sys.argv:
+      check_update(n, seed or 0, max_steps, **options)
+      sys.exit()
+    if '-bench' in sys.argv:
+      benchmark_workers(n, seed or 0, max_steps, int(sys.argv[sys.argv.index('-bench') + 1]), **options)
+      sys.exit()
+    if '-scale' in sys.argv:
+      benchmark_sizes(n, seed or 0, max_steps, int(sys.argv[sys.argv.index('-scale') + 1]), **options)
+      sys.exit()
+    workers = int(sys.argv[sys.argv.index('-workers') + 1]) if '-workers' in sys.argv else None
+    records = run_headless(n, seed or 0, max_steps, workers, **options)
+    print_stats(records)
+    if '-csv' in sys.argv:
+      write_csv(records, sys.argv[sys.argv.index('-csv') + 1])
+    sys.exit()
   
   # Define as entidades
-  cave = Cave()
-  kb = Knowledge()
+  size = options.get('size', (4, 4))
+  cave = Cave(size, options.get('pit_prob', 0.2), options.get('wumpuses', 1))
+  kb = Knowledge(size, options.get('wumpuses', 1))
   agent = Agent()
   
   # Mostra a introdução
@@ -87,7 +299,7 @@ if __name__ == '__main__':
   # Executa o jogo
   while True:
     print('Agente:\n{}'.format(agent))
-    print_cave(agent.location)
+    print_cave(agent.location, size)
     
     # Percepção na localidade corrente
     perceptions = perceive(cave, agent.location)
@@ -117,6 +329,6 @@ if __name__ == '__main__':
     
     # Verifica se o jogo terminou e o agente venceu
     if agent.has_gold and agent.location == (0, 0):
-      print_cave(agent.location)
+      print_cave(agent.location, size)
       print('Você Venceu!!')
       break
@@ -3,32 +3,52 @@
 
 # Módulo que define os movimentos do agente
 
+import heapq
+
 # Objeto DELTA usado para mover o agente e alcançar seus vizinhos
 DELTA = (0, -1), (1, 0), (0, 1), (-1, 0)
 
+# Vizinhos de cada quarto, calculados uma única vez por tamanho de caverna
+_NEIGHBORS = {}
+
 
 def neighbors(location, size=(4, 4)):
   
-  """Retorna um gerador para os quartos vizinhos."""
+  """Retorna uma tupla com os quartos vizinhos (acima, à direita, abaixo, à esquerda)."""
   
-  x, y = location
+  table = _NEIGHBORS.get(size)
+  if table is None:
+    table = _NEIGHBORS[size] = neighbor_table(size)
+  return table[location]
+
+
+def neighbor_table(size):
+
+  """Calcula os vizinhos de todos os quartos de uma caverna."""
+
   width, height = size
-  
-  #  célula acima
-  if y - 1 >= 0:
-    yield x, y - 1
-  
-  # célula à direita
-  if x + 1 < width:
-    yield x + 1, y
-  
-  # célula abaixo
-  if y + 1 < height:
-    yield x, y + 1
-  
-  # célula à esquerda
-  if x - 1 >= 0:
-    yield x - 1, y
+  table = {}
+  for y in range(height):
+    for x in range(width):
+      near = []
+
+      #  célula acima
+      if y - 1 >= 0:
+        near.append((x, y - 1))
+
+      # célula à direita
+      if x + 1 < width:
+        near.append((x + 1, y))
+
+      # célula abaixo
+      if y + 1 < height:
+        near.append((x, y + 1))
+
+      # célula à esquerda
+      if x - 1 >= 0:
+        near.append((x - 1, y))
+      table[x, y] = tuple(near)
+  return table
 
 
 def neighbor(location, direction, size=(4, 4)):
@@ -51,18 +71,18 @@ def turn(direction, steps):
   return (direction + steps) % len(DELTA)
 
 
-def move_forward(location, direction):
+def move_forward(location, direction, size=(4, 4)):
   
   """Retorna o novo local."""
   
-  return neighbor(location, direction)
+  return neighbor(location, direction, size)
 
 
-def spins(source, direction, destination):
+def spins(source, direction, destination, size=(4, 4)):
 
   """Obtém o número de rotações necessárias para ter a sala de destino à frente."""
 
-  assert source in neighbors(destination)
+  assert source in neighbors(destination, size)
   
   # Calcula a diferença entre os locais
   diff = tuple([a - b for a, b in zip(destination, source)])
@@ -73,48 +93,91 @@ def spins(source, direction, destination):
   return rot
 
 
-def known_path_rec(kb, loc, dest, path, visited):
+def turn_cost(direction, target):
 
-  """Algoritmo de Busca: Pesquisa em profundidade que constrói um caminho explorado para o destino."""
+  """Número mínimo de giros de 90 graus para sair de uma direção e ficar na outra."""
 
-  if loc == dest:
-    return True
-  
-  # Gerador de vizinhos explorados (mas ainda não visitados pela pesquisa)
-  neighborhood = (l for l in neighbors(loc) if l not in visited 
-                  and (kb[l].is_explored or l == dest))
-  
-  # Iterar sobre cada vizinho
-  for n in neighborhood:
-    
-    # Adiciona o nó ao caminho
-    path.append(n)
-    visited.add(n)
-    
-    # Chamada recursiva
-    if known_path_rec(kb, n, dest, path, visited):
-      return True
-    
-    # Backtrack: este nó não conduz ao destino
-    visited.remove(n)
-    path.remove(n)
-  return False
+  diff = (target - direction) % len(DELTA)
+  return min(diff, len(DELTA) - diff)
+
+
+class DistanceField:
+
+  """Custo mínimo (1 por movimento mais os giros) de cada estado (sala, direção)
+  até o destino, andando só por salas exploradas. É calculado sob demanda por um
+  Dijkstra reverso a partir do destino, que continua de onde parou a cada consulta."""
+
+  def __init__(self, kb, dest):
+
+    """Inicializa o campo; chegar ao destino com qualquer direção custa 0."""
+
+    self.kb = kb
+    self.dest = dest
+    self.settled = {}
+    self.best = {(dest, d): 0 for d in range(len(DELTA))}
+    self.heap = [(0, dest, d) for d in range(len(DELTA))]
 
 
-def known_path(kb, loc, dest):
+  def cost(self, location, direction):
+
+    """Retorna o custo do estado até o destino, ou None se o destino é inalcançável."""
+
+    state = location, direction
+    settled = self.settled
+    width, height = self.kb.size
+    while state not in settled and self.heap:
+      cost, (x, y), d = heapq.heappop(self.heap)
+      if ((x, y), d) in settled:
+        continue
+      settled[(x, y), d] = cost
+
+      # Estado anterior: a sala atrás, de onde se chega andando para frente na direção d
+      dx, dy = DELTA[d]
+      source = x - dx, y - dy
+      if not (0 <= source[0] < width and 0 <= source[1] < height and self.kb[source].is_explored):
+        continue
+      for before in range(len(DELTA)):
+        total = cost + 1 + turn_cost(before, d)
+        if total < self.best.get((source, before), total + 1):
+          self.best[source, before] = total
+          heapq.heappush(self.heap, (total, source, before))
+    return settled.get(state)
+
+
+def known_path(kb, loc, dest, direction=None):
   
-  """Retorna um caminho explorado para o destino."""
+  """Retorna o caminho explorado mais barato até o destino, contando 1 por movimento
+   mais os giros a partir de direction (sem direção, o primeiro giro é gratuito).
+   Retorna None se não houver caminho."""
   
+  if loc == dest:
+    return (loc,)
+  field = kb.distance_field(dest) if hasattr(kb, 'distance_field') else DistanceField(kb, dest)
   path = [loc]
-  visited = set()
-  visited.add(loc)
-  
-  # Retorna o caminho ou nenhum se o caminho não foi encontrado
-  if known_path_rec(kb, loc, dest, path, visited):
-    return tuple(path)
+  while loc != dest:
+
+    # Segue para o vizinho de menor custo total (giro + movimento + restante)
+    best = None
+    for d in range(len(DELTA)):
+      n = neighbor(loc, d, kb.size)
+      if n is None or not (kb[n].is_explored or n == dest):
+        continue
+      cost = field.cost(n, d)
+      if cost is None:
+        continue
+      cost += 1 + (0 if direction is None else turn_cost(direction, d))
+      if best is None or cost < best[0]:
+        best = cost, n, d
+    
+    # Retorna nenhum se o caminho não foi encontrado
+    if best is None:
+      return None
+    cost, loc, direction = best
+    path.append(loc)
+  return tuple(path)
 
 
-def path_to_spins(path, direction):
+def path_to_spins(path, direction, size=(4, 4)):
   
   """Obtém uma lista de rotações que um agente deve executar para seguir o caminho."""
   
@@ -126,7 +189,7 @@ def path_to_spins(path, direction):
   # até alcançar a última localização do caminho
   i = 0
   while i < len(path) - 1:
-    rot = spins(path[i], direction, path[i + 1])
+    rot = spins(path[i], direction, path[i + 1], size)
     rotations.append(rot)
     direction = (direction + rot) % len(DELTA)
     i += 1